@@ -0,0 +1,207 @@
+"""
+Concurrency per worker: sync views under WSGI vs async views under ASGI.
+
+Each mode serves the app from one worker process against slow local
+upstream stubs:
+- wsgi: the sync views on a pool of ``--threads`` threads, like one
+  gunicorn gthread worker;
+- asgi: the async views (ASYNC_VIEWS=true) on one uvicorn worker.
+
+Every request misses the caches and waits ``--latency`` seconds on the
+upstream, so throughput shows how many slow calls one worker holds at once.
+
+    python -m benchmarks.asgi_concurrency --endpoint geocode --concurrency 50 200
+    python -m benchmarks.asgi_concurrency --endpoint message --latency 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import httpx
+
+from benchmarks.common import StubServer, setup_django, summarize
+from benchmarks.stubs import tomtom_handler, make_hf_handler
+
+
+class PooledWSGIServer(WSGIServer):
+    """WSGI server handling connections on a fixed pool of threads."""
+
+    request_queue_size = 1024
+
+    def __init__(self, address, threads):
+        super().__init__(address, QuietHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve(args):
+    """Child process: run one worker in ``args.mode`` and print its token once ready."""
+    if args.mode == "asgi":
+        os.environ["ASYNC_VIEWS"] = "true"
+
+    setup_django()
+
+    import builtins
+    builtins.print = lambda *a, **k: None
+
+    from django.conf import settings
+    from benchmarks.seed import seed
+
+    settings.TOMTOM_API_URL = args.tomtom_url
+    settings.HF_API_URL = args.hf_url
+    settings.ADMISSION_ENABLED = False
+    settings.RESPONSE_CACHE_ENABLED = False
+
+    token = seed(users=1, chat_lengths=(2,))[0]["token"]
+    ready = json.dumps({"token": token})
+
+    if args.mode == "asgi":
+        import uvicorn
+        from django.core.asgi import get_asgi_application
+
+        config = uvicorn.Config(
+            get_asgi_application(),
+            host="127.0.0.1",
+            port=args.port,
+            log_level="warning",
+            lifespan="off"
+        )
+        server = uvicorn.Server(config)
+        sys.stdout.write(ready + "\n")
+        sys.stdout.flush()
+        server.run()
+    else:
+        from django.core.wsgi import get_wsgi_application
+
+        server = PooledWSGIServer(("127.0.0.1", args.port), args.threads)
+        server.set_app(get_wsgi_application())
+        sys.stdout.write(ready + "\n")
+        sys.stdout.flush()
+        server.serve_forever()
+
+
+async def drive(base_url, token, endpoint, total, concurrency):
+    samples = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        async def one_call(i):
+            nonlocal errors
+
+            if endpoint == "geocode":
+                request = client.post("/api/chat/geocode/", json={"query": f"Bench city {i} {time.time()}"})
+            else:
+                request = client.post(
+                    "/api/chat/message/",
+                    json={"message": f"Plan trip {i} {time.time()}"},
+                    headers={"Authorization": f"Bearer {token}"}
+                )
+
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    ok = (await request).status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                samples.append(time.perf_counter() - start)
+
+                if not ok:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_call(i) for i in range(total)))
+        wall = time.perf_counter() - started
+
+    report = summarize(samples)
+    report["errors"] = errors
+    report["throughput_rps"] = round(total / wall, 2)
+    return report
+
+
+def start_worker(mode, port, args, tomtom_url, hf_url):
+    command = [
+        sys.executable, "-m", "benchmarks.asgi_concurrency", "--serve", mode,
+        "--port", str(port), "--threads", str(args.threads),
+        "--tomtom-url", tomtom_url, "--hf-url", hf_url
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    token = json.loads(process.stdout.readline())["token"]
+    base_url = f"http://127.0.0.1:{port}"
+
+    # Wait until the server accepts connections
+    for _ in range(100):
+        try:
+            httpx.get(f"{base_url}/metrics", timeout=1)
+            break
+        except httpx.HTTPError:
+            time.sleep(0.1)
+
+    return process, base_url, token
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=["geocode", "message"], default="geocode")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 200])
+    parser.add_argument("--requests", type=int, default=400, help="Requests per concurrency level.")
+    parser.add_argument("--threads", type=int, default=8, help="Threads of the WSGI worker.")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds each upstream call takes.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", choices=["wsgi", "asgi"], dest="mode", help=argparse.SUPPRESS)
+    parser.add_argument("--tomtom-url", help=argparse.SUPPRESS)
+    parser.add_argument("--hf-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        serve(args)
+        return
+
+    report = {"config": vars(args)}
+    latency = lambda: args.latency
+
+    with StubServer(tomtom_handler, latency) as tomtom, \
+            StubServer(make_hf_handler(reply_words=20), latency) as hf:
+        hf_url = f"{hf.url}/v1/chat/completions"
+
+        for mode in ("wsgi", "asgi"):
+            process, base_url, token = start_worker(mode, args.port, args, tomtom.url, hf_url)
+
+            try:
+                report[mode] = {
+                    str(concurrency): asyncio.run(
+                        drive(base_url, token, args.endpoint, args.requests, concurrency)
+                    )
+                    for concurrency in args.concurrency
+                }
+            finally:
+                process.terminate()
+                process.wait()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Run the scripts from the Backend directory, e.g.
+``python -m benchmarks.nearby_images``. They use mongomock unless
+BENCHMARK_REAL_MONGO=1, in which case MONGO_URI from the environment is used.
+Benchmarks of the async views also need mongomock_motor for mongomock runs.
+"""
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def setup_django(use_mongomock=None):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-not-for-production")
+
+    import django
+    django.setup()
+
+    if use_mongomock is None:
+        use_mongomock = not os.getenv("BENCHMARK_REAL_MONGO")
+
+    if use_mongomock:
+        import mongomock
+        from mongoengine import connect, disconnect
+
+        disconnect()
+        connect(
+            db="travel_ai",
+            host="mongodb://localhost",
+            mongo_client_class=mongomock.MongoClient
+        )
+
+        # Async views reach Mongo through core.mongo; point them at the same
+        # mongomock data if mongomock_motor is installed
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            return
+
+        import core.mongo
+        from mongoengine.connection import get_db
+
+        sync_client = get_db().client
+        core.mongo.get_async_db = lambda: AsyncMongoMockClient(mock_mongo_client=sync_client)["travel_ai"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 2) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+def latency_profile(base, slow=0.0, slow_rate=0.0):
+    """Return a callable giving ``base`` seconds, or ``slow`` with probability ``slow_rate``."""
+    def latency():
+        if slow_rate and random.random() < slow_rate:
+            return slow
+        return base
+    return latency
+
+
+class StubServer:
+    """
+    Minimal threaded HTTP server standing in for an upstream API.
+
+    ``handler(method, path, query, body)`` returns ``(status, payload)``;
+    dict payloads are sent as JSON, and iterables of bytes are streamed with
+    chunked encoding (one chunk per item). ``latency()`` is slept before
+    replying, and ``error_rate`` of requests get a 503 instead.
+    """
+
+    def __init__(self, handler, latency=None, error_rate=0.0):
+        self.handler = handler
+        self.latency = latency or (lambda: 0.0)
+        self.error_rate = error_rate
+        self.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_request_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def _make_request_handler(self):
+        stub = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self, method):
+                stub.requests += 1
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                parsed = urlparse(self.path)
+
+                time.sleep(stub.latency())
+
+                if stub.error_rate and random.random() < stub.error_rate:
+                    status, payload = 503, {"error": "stub failure"}
+                else:
+                    status, payload = stub.handler(method, parsed.path, parse_qs(parsed.query), body)
+
+                if isinstance(payload, (dict, list)):
+                    payload = json.dumps(payload).encode()
+
+                self.send_response(status)
+
+                if isinstance(payload, bytes):
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                try:
+                    for chunk in payload:
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        self.wfile.flush()
+
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading mid-stream
+                    self.close_connection = True
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, *args):
+                pass
+
+        return RequestHandler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,84 @@
+"""
+Microbenchmark of nearby_places distance ranking: scalar calculate_distance
+per place (old) vs one batch haversine_km call over the candidate set.
+
+Both variants measure, filter to the search radius and sort by distance.
+
+    python -m benchmarks.distance --sizes 10 100 10000
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.common import setup_django, summarize
+
+
+def make_places(count, lat, lon, spread=0.03):
+    return [
+        {
+            "latitude": lat + random.uniform(-spread, spread),
+            "longitude": lon + random.uniform(-spread, spread)
+        }
+        for _ in range(count)
+    ]
+
+
+def scalar_rank(lat, lon, places, max_distance_km):
+    from chat.views import calculate_distance
+
+    ranked = []
+
+    for place in places:
+        distance = calculate_distance(lat, lon, place["latitude"], place["longitude"])
+
+        if distance <= max_distance_km:
+            ranked.append((place, distance))
+
+    ranked.sort(key=lambda item: item[1])
+    return ranked
+
+
+def measure(iterations, call):
+    samples = []
+
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+
+    report = summarize(samples)
+    report["mean_us"] = round(sum(samples) / len(samples) * 1e6, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 10000])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from chat.views import rank_by_distance
+
+    lat, lon, max_distance_km = 15.49, 73.83, 2.0
+    report = {"iterations": args.iterations}
+
+    for size in args.sizes:
+        places = make_places(size, lat, lon)
+
+        scalar = measure(args.iterations, lambda: scalar_rank(lat, lon, places, max_distance_km))
+        batch = measure(args.iterations, lambda: rank_by_distance(lat, lon, places, max_distance_km))
+
+        report[str(size)] = {
+            "scalar": scalar,
+            "batch": batch,
+            "speedup": round(scalar["mean_us"] / batch["mean_us"], 2)
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Microbenchmark of DRF's JSONRenderer/JSONParser vs core.fastjson's orjson
+versions, on payloads shaped like real responses:
+
+- history: get_chat_history for a ``--messages`` long chat;
+- list: list_user_chats for ``--chats`` chats (datetimes in every row);
+- nearby: a full page of nearby_places results.
+
+Parsing is measured on the rendered payloads. Also checks that both
+renderers' output decodes to the same values.
+
+    python -m benchmarks.json_codec --messages 1000 --iterations 200
+"""
+import argparse
+import io
+import json
+import time
+
+from benchmarks.common import setup_django, summarize
+
+
+def measure(iterations, call):
+    samples = []
+
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+
+    report = summarize(samples)
+    # Sub-millisecond timings: microseconds are more readable
+    report["mean_us"] = round(sum(samples) / len(samples) * 1e6, 2)
+    return report
+
+
+def payloads(messages, chats):
+    from django.conf import settings
+    from rest_framework.test import APIRequestFactory
+    from benchmarks.seed import seed
+    from benchmarks.stubs import tomtom_handler
+    from chat import views
+
+    seeded = seed(users=1, chat_lengths=(messages,) + (2,) * (chats - 1))[0]
+    chat_id = seeded["chat_ids"][0]
+    auth = {"HTTP_AUTHORIZATION": f"Bearer {seeded['token']}"}
+
+    settings.CHAT_HISTORY_MAX_MESSAGES = max(settings.CHAT_HISTORY_MAX_MESSAGES, messages)
+    settings.CHAT_LIST_MAX_CHATS = max(settings.CHAT_LIST_MAX_CHATS, chats)
+
+    factory = APIRequestFactory()
+    history = views.get_chat_history(
+        factory.get(f"/api/chat/history/{chat_id}/", {"latest": messages}, **auth), chat_id
+    ).data
+    chat_list = views.list_user_chats(
+        factory.get("/api/chat/list/", {"limit": chats}, **auth)
+    ).data
+
+    lat, lon = 15.4909, 73.8278
+    _, search = tomtom_handler("GET", "/search/2/nearbySearch/.json", {
+        "lat": [str(lat)], "lon": [str(lon)], "limit": [str(settings.NEARBY_FETCH_LIMIT)]
+    }, None)
+    candidates = views.parse_nearby_results(search)
+    _, nearby = views.nearby_results(
+        lat, lon, candidates, settings.NEARBY_FETCH_LIMIT, 0, views.NEARBY_RADIUS_M / 1000
+    )
+
+    for i, result in enumerate(nearby):
+        result["image"] = f"https://images.pexels.com/photos/{1000 + i}/pexels-photo.jpeg"
+
+    return {"history": history, "list": chat_list, "nearby": nearby}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from core.fastjson import ORJSONParser, ORJSONRenderer
+
+    codecs = {
+        "drf": (JSONRenderer(), JSONParser()),
+        "orjson": (ORJSONRenderer(), ORJSONParser()),
+    }
+    report = {"config": vars(args)}
+
+    for name, data in payloads(args.messages, args.chats).items():
+        rendered = {codec: renderer.render(data) for codec, (renderer, _) in codecs.items()}
+        result = {
+            "bytes": len(rendered["drf"]),
+            "same_output": json.loads(rendered["drf"]) == json.loads(rendered["orjson"]),
+        }
+
+        for codec, (renderer, json_parser) in codecs.items():
+            body = rendered["drf"]
+            result[codec] = {
+                "render": measure(args.iterations, lambda: renderer.render(data)),
+                "parse": measure(args.iterations, lambda: json_parser.parse(io.BytesIO(body))),
+            }
+
+        result["render_speedup"] = round(
+            result["drf"]["render"]["mean_us"] / result["orjson"]["render"]["mean_us"], 1
+        )
+        result["parse_speedup"] = round(
+            result["drf"]["parse"]["mean_us"] / result["orjson"]["parse"]["mean_us"], 1
+        )
+        report[name] = result
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+End-to-end load test of the chat and location endpoints.
+
+Starts local stubs for HF, TomTom and Pexels, seeds users and chats, serves
+the Django WSGI app on a local threaded server and drives each endpoint at
+``--concurrency``. Reports throughput and p50/p95/p99 per endpoint and saves
+the run as JSON so runs can be compared:
+
+    python -m benchmarks.loadtest --concurrency 16 --requests 200 --output before.json
+
+Use --target to drive an already running server instead (it must share the
+database and point its upstream URLs at stubs; see benchmarks.stubs).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import requests
+
+from benchmarks.common import setup_django, summarize
+from benchmarks.seed import PROMPTS, seed
+from benchmarks.stubs import add_stub_arguments, start_stubs
+
+CITIES = ["Paris", "Goa", "Jaipur", "Manali", "Lisbon", "Kyoto", "Nowhere Land"]
+
+# Busy spots: most nearby searches land close to one of these
+HOTSPOTS = [(15.4909, 73.8278), (48.8584, 2.2945), (26.9124, 75.7873)]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def build_scenarios(base_url, users):
+    """Return ``{endpoint: callable(session) -> response}``."""
+
+    def auth(user):
+        return {"Authorization": f"Bearer {user['token']}"}
+
+    def send_message(session):
+        user = random.choice(users)
+        return session.post(f"{base_url}/api/chat/message/", headers=auth(user), json={
+            "message": random.choice(PROMPTS),
+            "chat_id": random.choice(user["chat_ids"] + [None]),
+        })
+
+    def nearby_places(session):
+        lat, lon = random.choice(HOTSPOTS)
+        return session.post(f"{base_url}/api/chat/nearby/", json={
+            "latitude": lat + random.uniform(-0.01, 0.01),
+            "longitude": lon + random.uniform(-0.01, 0.01),
+        })
+
+    def geocode_location(session):
+        return session.post(f"{base_url}/api/chat/geocode/", json={"query": random.choice(CITIES)})
+
+    def get_chat_history(session):
+        user = random.choice(users)
+        chat_id = random.choice(user["chat_ids"])
+        return session.get(f"{base_url}/api/chat/history/{chat_id}/", headers=auth(user))
+
+    def list_user_chats(session):
+        return session.get(f"{base_url}/api/chat/list/", headers=auth(random.choice(users)))
+
+    return {
+        "send_message": send_message,
+        "nearby_places": nearby_places,
+        "geocode_location": geocode_location,
+        "get_chat_history": get_chat_history,
+        "list_user_chats": list_user_chats,
+    }
+
+
+def drive(scenario, total, concurrency):
+    """Run ``total`` calls of ``scenario`` from ``concurrency`` clients."""
+    samples = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one_call(_):
+        nonlocal errors
+
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+
+        start = time.perf_counter()
+        try:
+            ok = scenario(local.session).status_code < 500
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            samples.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_call, range(total)))
+    wall = time.perf_counter() - started
+
+    report = summarize(samples)
+    report["errors"] = errors
+    report["throughput_rps"] = round(total / wall, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint.")
+    parser.add_argument("--endpoints", default="all",
+                        help="Comma-separated endpoint names, or 'all'.")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--chat-lengths", default="2,10,50,200")
+    parser.add_argument("--target", help="Base URL of a running server to drive instead.")
+    parser.add_argument("--output", help="Write the JSON report to this file.")
+    parser.add_argument("--admission", action="store_true",
+                        help="Keep send_message admission limits on in the in-process server (off by default).")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    setup_django()
+
+    # A few simulated users sending as fast as possible would mostly get
+    # 429s; only measure the limits when asked to
+    from django.conf import settings
+    settings.ADMISSION_ENABLED = args.admission
+
+    # The load generator's own prints would dominate the output
+    import builtins
+    quiet_print = builtins.print
+    builtins.print = lambda *a, **k: None
+
+    lengths = [int(n) for n in args.chat_lengths.split(",")]
+    users = seed(args.users, lengths)
+
+    with start_stubs(args) as stubs:
+        server = None
+
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            from django.core.wsgi import get_wsgi_application
+            server = make_server(
+                "127.0.0.1", 0, get_wsgi_application(),
+                server_class=ThreadingWSGIServer,
+                handler_class=QuietHandler
+            )
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+
+        scenarios = build_scenarios(base_url, users)
+        names = list(scenarios) if args.endpoints == "all" else args.endpoints.split(",")
+
+        results = {}
+        for name in names:
+            results[name] = drive(scenarios[name], args.requests, args.concurrency)
+
+        upstream_calls = {name: stub.requests for name, stub in stubs.items()}
+
+        if server:
+            server.shutdown()
+
+    builtins.print = quiet_print
+
+    report = {
+        "started_at": datetime.utcnow().isoformat(),
+        "config": vars(args),
+        "results": results,
+        "upstream_calls": upstream_calls,
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark nearby_places image lookups: sequential (old) vs concurrent fan-out.
+
+TomTom and Pexels are replaced by local stubs; Pexels answers in
+``--base`` seconds, except ``--slow-rate`` of calls which take ``--slow``.
+
+    python -m benchmarks.nearby_images --iterations 30
+"""
+import argparse
+import json
+import time
+from contextlib import nullcontext
+
+from benchmarks.common import StubServer, latency_profile, setup_django, summarize
+from benchmarks.stubs import tomtom_handler, pexels_handler
+
+
+def sequential_images(queries, deadline=None):
+    from chat import views
+    return [views.get_pexels_image(query) or views.FALLBACK_IMAGE for query in queries]
+
+
+def clear_caches():
+    from chat.cache import caches
+    from chat.models import CacheEntry
+
+    for cache in caches.values():
+        cache.local.clear()
+    CacheEntry.objects.delete()
+
+
+def run(iterations, mode):
+    from unittest import mock
+    from django.test import Client
+    from chat import views
+
+    client = Client()
+    samples = []
+
+    if mode == "sequential":
+        patch = mock.patch.object(views, "fetch_place_images", sequential_images)
+    else:
+        patch = nullcontext()
+
+    with patch:
+        for i in range(iterations):
+            # Measure cold lookups: every iteration starts with empty caches
+            clear_caches()
+            start = time.perf_counter()
+            response = client.post(
+                "/api/chat/nearby/",
+                {"latitude": 15.5 + i * 0.01, "longitude": 73.8},
+                content_type="application/json"
+            )
+            samples.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.content
+
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--base", type=float, default=0.1)
+    parser.add_argument("--slow", type=float, default=2.0)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+
+    latency = latency_profile(args.base, args.slow, args.slow_rate)
+
+    with StubServer(tomtom_handler) as tomtom, StubServer(pexels_handler, latency) as pexels:
+        settings.TOMTOM_API_URL = tomtom.url
+        settings.PEXELS_API_URL = pexels.url
+
+        report = {
+            "config": vars(args),
+            "sequential": run(args.iterations, "sequential"),
+            "concurrent": run(args.iterations, "concurrent"),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+CPU time and memory per request of get_chat_history and list_user_chats,
+reading hydrated mongoengine documents (CHAT_RAW_READS=false) vs raw BSON
+rows mapped straight to response dicts (CHAT_RAW_READS=true).
+
+History requests fetch a whole ``--messages`` long chat in one page; list
+requests return ``--chats`` chats. Each request runs the view and renders
+the JSON response. Memory is the tracemalloc peak of a separate pass, as
+tracing slows everything down. With mongomock the driver's own cost is
+pure Python too; use BENCHMARK_REAL_MONGO=1 for production-like numbers.
+
+    python -m benchmarks.read_path --messages 1000 --iterations 50
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.common import setup_django, summarize
+
+
+def measure(call, iterations):
+    cpu = []
+    wall = []
+
+    for _ in range(iterations):
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        call()
+        wall.append(time.perf_counter() - wall_start)
+        cpu.append(time.process_time() - cpu_start)
+
+    peaks = []
+
+    for _ in range(min(iterations, 5)):
+        tracemalloc.start()
+        call()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    report = summarize(wall)
+    report["cpu_mean_ms"] = round(sum(cpu) / len(cpu) * 1000, 2)
+    report["peak_kib"] = round(max(peaks) / 1024, 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000, help="Length of the chat whose history is read.")
+    parser.add_argument("--chats", type=int, default=200, help="Chats the user has, for the list.")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+    from rest_framework.test import APIRequestFactory
+    from benchmarks.seed import seed
+    from chat.views import get_chat_history, list_user_chats
+
+    seeded = seed(users=1, chat_lengths=(args.messages,) + (2,) * (args.chats - 1))[0]
+    chat_id = seeded["chat_ids"][0]
+    auth = {"HTTP_AUTHORIZATION": f"Bearer {seeded['token']}"}
+
+    settings.CHAT_HISTORY_MAX_MESSAGES = max(settings.CHAT_HISTORY_MAX_MESSAGES, args.messages)
+    settings.CHAT_LIST_MAX_CHATS = max(settings.CHAT_LIST_MAX_CHATS, args.chats)
+
+    factory = APIRequestFactory()
+
+    def history():
+        request = factory.get(f"/api/chat/history/{chat_id}/", {"latest": args.messages}, **auth)
+        response = get_chat_history(request, chat_id)
+        response.render()
+        assert len(response.data["messages"]) == args.messages
+
+    def chat_list():
+        request = factory.get("/api/chat/list/", {"limit": args.chats}, **auth)
+        response = list_user_chats(request)
+        response.render()
+        assert len(response.data["chats"]) == args.chats
+
+    report = {"config": vars(args)}
+    bodies = {}
+
+    for raw in (False, True):
+        settings.CHAT_RAW_READS = raw
+        path = "raw" if raw else "documents"
+
+        # Warm up imports and caches before measuring
+        history()
+        chat_list()
+
+        report[path] = {
+            "history": measure(history, args.iterations),
+            "list": measure(chat_list, args.iterations),
+        }
+
+        bodies[path] = (
+            get_chat_history(factory.get(f"/api/chat/history/{chat_id}/", {"latest": args.messages}, **auth), chat_id).data,
+            list_user_chats(factory.get("/api/chat/list/", {"limit": args.chats}, **auth)).data
+        )
+
+    report["same_responses"] = bodies["raw"] == bodies["documents"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
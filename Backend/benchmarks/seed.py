@@ -0,0 +1,93 @@
+"""
+Seed users with chats of varying length for the load tests.
+
+Used by benchmarks.loadtest against mongomock; run it directly to seed a
+real database (BENCHMARK_REAL_MONGO=1, MONGO_URI=...):
+
+    python -m benchmarks.seed --users 50 --chat-lengths 2,10,50,200
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from benchmarks.common import setup_django
+
+PROMPTS = [
+    "3 day trip to Goa under 20000",
+    "Plan a weekend in Jaipur for two",
+    "What is the best time to visit Manali?",
+    "How do I get from the airport to the old town?",
+    "Suggest vegetarian food near the beach",
+    "Is it safe to travel there in the monsoon?",
+]
+
+
+def seed(users=20, chat_lengths=(2, 10, 50, 200), random_seed=42):
+    """
+    Create ``users`` users, each with one chat per entry of ``chat_lengths``.
+
+    Returns one ``{"user_id", "token", "chat_ids"}`` dict per user. Messages
+    are written with insert_many, which keeps seeding large chats fast.
+    """
+    import jwt
+    from django.conf import settings
+    from chat.messages import record_activity
+    from chat.models import ChatSession, Message
+    from users.models import User
+
+    rng = random.Random(random_seed)
+    start = datetime.utcnow() - timedelta(days=30)
+    seeded = []
+
+    for u in range(users):
+        email = f"loadtest-{u}@example.com"
+        user = User.objects(email=email).first() or User(email=email, name=f"Load Test {u}").save()
+
+        chat_ids = []
+
+        for length in chat_lengths:
+            chat = ChatSession(user=user, title=f"{length} message chat", created_at=start).save()
+            chat_ids.append(str(chat.id))
+
+            messages = [
+                {
+                    "_id": ObjectId(),
+                    "chat": chat.id,
+                    "role": "user" if i % 2 == 0 else "assistant",
+                    "content": rng.choice(PROMPTS) if i % 2 == 0 else "Here is a plan. " * rng.randint(5, 60),
+                    "created_at": start + timedelta(seconds=i),
+                }
+                for i in range(length)
+            ]
+            Message._get_collection().insert_many(messages)
+
+            if messages:
+                record_activity(chat.id, length, messages[-1]["content"], messages[-1]["created_at"])
+
+        token = jwt.encode(
+            {"user_id": str(user.id), "email": email, "exp": int(time.time()) + 24 * 60 * 60},
+            settings.SECRET_KEY,
+            algorithm="HS256"
+        )
+        seeded.append({"user_id": str(user.id), "token": token, "chat_ids": chat_ids})
+
+    return seeded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--chat-lengths", default="2,10,50,200")
+    args = parser.parse_args()
+
+    setup_django()
+    lengths = [int(n) for n in args.chat_lengths.split(",")]
+    print(json.dumps(seed(args.users, lengths), indent=2))
+
+
+if __name__ == "__main__":
+    main()
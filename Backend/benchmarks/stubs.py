@@ -0,0 +1,149 @@
+"""
+Local stand-ins for the upstream APIs: the HF router, TomTom and Pexels.
+
+``start_stubs`` runs one StubServer per upstream and points the Django
+settings at them, so the views run unchanged against local servers with
+controllable latency and error rates.
+"""
+import json
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from benchmarks.common import StubServer
+
+REPLY_WORDS = (
+    "Day 1: arrive, check in and walk the old town. Day 2: beaches in the "
+    "morning, local seafood for lunch and a sunset cruise. Budget: stay 6000, "
+    "food 4000, transport 3000, activities 5000."
+).split()
+
+
+def tomtom_handler(method, path, query, body):
+    if "/nearbySearch/" in path:
+        lat = float(query["lat"][0])
+        lon = float(query["lon"][0])
+        categories = ["restaurant", "park", "tourist attraction", "amusement park"]
+        results = [
+            {
+                "id": f"poi-{lat:.3f}-{lon:.3f}-{i}",
+                "poi": {"name": f"Place {i}", "categories": [categories[i % len(categories)]]},
+                "position": {"lat": lat + (i % 7 - 3) * 0.002, "lon": lon + (i % 5 - 2) * 0.002},
+            }
+            for i in range(int(query.get("limit", ["10"])[0]))
+        ]
+        return 200, {"results": results}
+
+    if "/reverseGeocode/" in path:
+        return 200, {"addresses": [{"address": {
+            "municipality": "Panaji",
+            "countrySubdivision": "Goa",
+            "country": "India",
+        }}]}
+
+    if "/geocode/" in path:
+        if query["query"][0].lower().startswith("nowhere"):
+            return 200, {"results": []}
+        return 200, {"results": [{"position": {"lat": 15.4909, "lon": 73.8278}}]}
+
+    return 404, {"error": "unknown path"}
+
+
+def pexels_handler(method, path, query, body):
+    name = query["query"][0].replace(" ", "-")
+    return 200, {"photos": [{"src": {"large": f"https://images.example/{name}.jpg"}}]}
+
+
+def make_hf_handler(token_delay=0.0, reply_words=60, finish_reason="stop", cut_off_after=None):
+    """
+    HF chat completions; streams one word per ``token_delay`` when asked to.
+
+    A stream ends like the router's: a chunk with ``finish_reason``, one
+    with the usage if requested, then ``[DONE]``. With ``cut_off_after`` it
+    ends after that many words instead, as if the connection dropped.
+    """
+    words = (REPLY_WORDS * (reply_words // len(REPLY_WORDS) + 1))[:reply_words]
+
+    def sse(chunk):
+        return f"data: {json.dumps(chunk)}\n\n".encode()
+
+    def stream(include_usage):
+        for i, word in enumerate(words):
+            if i == cut_off_after:
+                return
+            if token_delay:
+                time.sleep(token_delay)
+            yield sse({"choices": [{"delta": {"content": word + " "}}]})
+
+        yield sse({"choices": [{"delta": {}, "finish_reason": finish_reason}]})
+
+        if include_usage:
+            yield sse({"choices": [], "usage": {"prompt_tokens": 400, "completion_tokens": len(words)}})
+
+        yield b"data: [DONE]\n\n"
+
+    def handler(method, path, query, body):
+        payload = json.loads(body or b"{}")
+
+        if payload.get("stream"):
+            return 200, stream((payload.get("stream_options") or {}).get("include_usage"))
+
+        if token_delay:
+            time.sleep(token_delay * len(words))
+
+        return 200, {
+            "choices": [{"message": {"content": " ".join(words)}}],
+            "usage": {"prompt_tokens": 400, "completion_tokens": len(words)},
+        }
+
+    return handler
+
+
+def add_stub_arguments(parser):
+    """Add --{hf,tomtom,pexels}-{latency,error-rate} options to an argparse parser."""
+    defaults = {"hf": 0.05, "tomtom": 0.08, "pexels": 0.1}
+
+    for name, latency in defaults.items():
+        parser.add_argument(f"--{name}-latency", type=float, default=latency,
+                            help=f"Seconds before the {name} stub answers.")
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0,
+                            help=f"Fraction of {name} requests answered with 503.")
+
+    parser.add_argument("--hf-token-delay", type=float, default=0.01,
+                        help="Seconds per generated word in the HF stub.")
+
+
+@contextmanager
+def start_stubs(args):
+    """Start the stubs described by ``add_stub_arguments`` options and route settings to them."""
+    from django.conf import settings
+
+    def jittered(base):
+        # +/-20% so percentiles are not all identical
+        return lambda: base * random.uniform(0.8, 1.2)
+
+    with ExitStack() as stack:
+        hf = stack.enter_context(StubServer(
+            make_hf_handler(args.hf_token_delay),
+            jittered(args.hf_latency),
+            args.hf_error_rate
+        ))
+        tomtom = stack.enter_context(StubServer(
+            tomtom_handler,
+            jittered(args.tomtom_latency),
+            args.tomtom_error_rate
+        ))
+        pexels = stack.enter_context(StubServer(
+            pexels_handler,
+            jittered(args.pexels_latency),
+            args.pexels_error_rate
+        ))
+
+        settings.HF_API_URL = f"{hf.url}/v1/chat/completions"
+        settings.TOMTOM_API_URL = tomtom.url
+        settings.PEXELS_API_URL = pexels.url
+        settings.WIKIPEDIA_API_URL = pexels.url
+        settings.UNSPLASH_API_URL = pexels.url
+
+        yield {"hf": hf, "tomtom": tomtom, "pexels": pexels}
+
@@ -0,0 +1,241 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from mongoengine.errors import NotUniqueError
+
+from core.cache import LRUCache, MISSING
+from core.metrics import Counter
+from .models import AdmissionBucket, AdmissionSlot
+
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "send_message requests rejected with 429, by the limit that was hit.",
+    labelnames=("reason",)
+)
+
+# In-flight slots free up when a generation finishes, which we cannot
+# predict; this is only a hint for well-behaved clients
+INFLIGHT_RETRY_AFTER = 2
+
+# Compare-and-set attempts on a shared bucket before giving up
+BUCKET_UPDATE_ATTEMPTS = 5
+
+
+class AdmissionRejected(Exception):
+    """Raised when a generation request is over a rate or concurrency limit."""
+
+    def __init__(self, message, reason, retry_after):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request; ``release()`` frees its in-flight slot (safe to call twice)."""
+
+    def __init__(self, release=None):
+        self._release = release
+
+    def release(self):
+        release, self._release = self._release, None
+
+        if release:
+            release()
+
+
+def refill(tokens, elapsed):
+    """Tokens in a bucket ``elapsed`` seconds after it held ``tokens``."""
+    return min(settings.ADMISSION_BURST, tokens + elapsed * settings.ADMISSION_RATE)
+
+
+def wait_for_token(tokens):
+    return (1 - tokens) / settings.ADMISSION_RATE
+
+
+def rate_limited(retry_after):
+    return AdmissionRejected("Too many messages, slow down", "rate", retry_after)
+
+
+def user_busy():
+    return AdmissionRejected(
+        "Too many replies in progress for this user", "user_inflight", INFLIGHT_RETRY_AFTER
+    )
+
+
+def server_busy():
+    return AdmissionRejected(
+        "Server is busy, try again shortly", "global_inflight", INFLIGHT_RETRY_AFTER
+    )
+
+
+class MemoryAdmission:
+    """
+    Per-process limits: a token bucket per user plus per-user and global
+    in-flight counters. Each worker process enforces its own limits.
+    """
+
+    def __init__(self):
+        # A bucket untouched for a full refill is full again, so it can expire
+        self.buckets = LRUCache(
+            maxsize=10000,
+            ttl=settings.ADMISSION_BURST / settings.ADMISSION_RATE
+        )
+        self.inflight = {}
+        self.total_inflight = 0
+        self._lock = threading.Lock()
+
+    def admit(self, user_id, hold_slot=True):
+        with self._lock:
+            if hold_slot:
+                if self.inflight.get(user_id, 0) >= settings.ADMISSION_USER_INFLIGHT:
+                    raise user_busy()
+                if self.total_inflight >= settings.ADMISSION_GLOBAL_INFLIGHT:
+                    raise server_busy()
+
+            now = time.monotonic()
+            bucket = self.buckets.get(user_id)
+
+            if bucket is MISSING:
+                tokens = settings.ADMISSION_BURST
+            else:
+                tokens = refill(bucket[0], now - bucket[1])
+
+            if tokens < 1:
+                raise rate_limited(wait_for_token(tokens))
+
+            self.buckets.set(user_id, (tokens - 1, now))
+
+            if not hold_slot:
+                return Ticket()
+
+            self.inflight[user_id] = self.inflight.get(user_id, 0) + 1
+            self.total_inflight += 1
+
+        return Ticket(lambda: self._release(user_id))
+
+    def _release(self, user_id):
+        with self._lock:
+            self.total_inflight -= 1
+            self.inflight[user_id] -= 1
+
+            if not self.inflight[user_id]:
+                del self.inflight[user_id]
+
+
+class MongoAdmission:
+    """
+    The same limits shared by all workers through Mongo.
+
+    Buckets are updated with compare-and-set. In-flight generations are
+    lease documents that expire after ADMISSION_SLOT_LEASE, so a crashed
+    worker cannot hold slots forever.
+    """
+
+    def admit(self, user_id, hold_slot=True):
+        slot = self._take_slot(user_id) if hold_slot else None
+
+        try:
+            self._take_token(user_id)
+        except AdmissionRejected:
+            if slot:
+                slot.delete()
+            raise
+
+        if not slot:
+            return Ticket()
+
+        return Ticket(slot.delete)
+
+    def _take_slot(self, user_id):
+        now = datetime.utcnow()
+        slot = AdmissionSlot(
+            user_id=user_id,
+            expires_at=now + timedelta(seconds=settings.ADMISSION_SLOT_LEASE)
+        ).save()
+
+        # Insert first, then count: concurrent requests may both back off,
+        # but never both get in over the limit
+        active = AdmissionSlot.objects(expires_at__gt=now)
+
+        if active.filter(user_id=user_id).count() > settings.ADMISSION_USER_INFLIGHT:
+            slot.delete()
+            raise user_busy()
+
+        if active.count() > settings.ADMISSION_GLOBAL_INFLIGHT:
+            slot.delete()
+            raise server_busy()
+
+        return slot
+
+    def _take_token(self, user_id):
+        for _ in range(BUCKET_UPDATE_ATTEMPTS):
+            now = datetime.utcnow()
+            bucket = AdmissionBucket.objects(key=user_id).first()
+
+            if bucket is None:
+                try:
+                    AdmissionBucket(
+                        key=user_id,
+                        tokens=settings.ADMISSION_BURST - 1,
+                        updated_at=now
+                    ).save(force_insert=True)
+                    return
+                except NotUniqueError:
+                    continue
+
+            tokens = refill(bucket.tokens, (now - bucket.updated_at).total_seconds())
+
+            if tokens < 1:
+                raise rate_limited(wait_for_token(tokens))
+
+            updated = AdmissionBucket.objects(
+                key=user_id,
+                tokens=bucket.tokens,
+                updated_at=bucket.updated_at
+            ).update_one(set__tokens=tokens - 1, set__updated_at=now)
+
+            if updated:
+                return
+
+        # Lost every race: the user is clearly sending in parallel
+        raise rate_limited(1)
+
+
+_admission = None
+_admission_lock = threading.Lock()
+
+
+def get_admission():
+    global _admission
+
+    with _admission_lock:
+        if _admission is None:
+            if settings.ADMISSION_BACKEND == "mongo":
+                _admission = MongoAdmission()
+            else:
+                _admission = MemoryAdmission()
+
+        return _admission
+
+
+def admit(user_id, hold_slot=True):
+    """
+    Admit one generation request for ``user_id`` or raise AdmissionRejected.
+
+    Takes a token from the user's bucket and, with ``hold_slot``, an
+    in-flight slot that stays taken until the returned ticket is released.
+    """
+    if not settings.ADMISSION_ENABLED:
+        return Ticket()
+
+    try:
+        return get_admission().admit(user_id, hold_slot=hold_slot)
+    except AdmissionRejected as e:
+        ADMISSION_REJECTED.inc(reason=e.reason)
+        raise
+    except Exception as e:
+        # Limits are protective only; a Mongo outage should not block chat
+        print("Admission error:", e)
+        return Ticket()
@@ -0,0 +1,418 @@
+"""
+Async versions of send_message, nearby_places, geocode_location and
+reverse_geocode, routed instead of the sync views when ASYNC_VIEWS is on.
+Run the app under ASGI (core.asgi) to benefit.
+
+Upstream calls use the async HTTP clients and the views' own Mongo reads
+and writes use the async Mongo client, so a request waiting on HF or TomTom
+holds no thread. Shared helpers that are quick (auth, admission,
+idempotency, the job queue, the POI store) or only occasionally slow
+(building the conversation context) run in threads via sync_to_async.
+Request parsing and response shapes are the sync views' own helpers.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.response import Response
+
+from core.mongo import ainsert, collection
+from users.auth_utils import get_user_from_request
+from . import idempotency, views
+from . import places as place_store
+from .cache import normalize_query
+from .context import build_conversation, schedule_fold
+from .gemini_service import agenerate_ai_response, astream_ai_response
+from .geo import geohash_encode, geohash_center, cell_half_diagonal_m
+from .jobs import enqueue_generation
+from .messages import asave_message, delete_message
+from .models import ChatSession
+from .upstream import upstream, UpstreamUnavailable
+
+
+def in_thread(func):
+    # Not thread-sensitive: nothing here uses Django's ORM connections, and
+    # a single shared thread would serialize every request
+    return sync_to_async(func, thread_sensitive=False)
+
+
+def json_body(request):
+    """The request's JSON object body; raise ValueError if it is not one."""
+    data = json.loads(request.body or b"{}")
+
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+
+    return data
+
+
+def as_json(response):
+    """A DRF Response from a shared sync helper, as a plain JsonResponse."""
+    if not isinstance(response, Response):
+        return response
+
+    json_response = JsonResponse(response.data, status=response.status_code, safe=False)
+
+    for header, value in response.items():
+        if header.lower() != "content-type":
+            json_response[header] = value
+
+    return json_response
+
+
+def error(message, status):
+    return JsonResponse({"error": message}, status=status)
+
+
+def stream_reply(chat, conversation_history, finish, record=None, use_cache=True):
+    """views.stream_reply, forwarding tokens from the async HF stream."""
+    async def event_stream():
+        chunks = []
+        completed = False
+
+        try:
+            yield views.sse_event("start", {"chat_id": str(chat.id)})
+
+            tokens = astream_ai_response(conversation_history, use_cache=use_cache)
+
+            try:
+                async for token in tokens:
+                    chunks.append(token)
+                    yield views.sse_event("token", {"token": token})
+
+                    if record and idempotency.renewal_due(record):
+                        await in_thread(idempotency.renew)(record)
+            finally:
+                await tokens.aclose()
+
+            completed = True
+            yield views.sse_event("done", {"chat_id": str(chat.id)})
+
+        except Exception as e:
+            yield views.sse_event("error", {"error": str(e)})
+
+        finally:
+            reply = "".join(chunks)
+            saved = False
+
+            try:
+                if reply:
+                    message = await asave_message(chat, "assistant", reply)
+                    saved = True
+                    schedule_fold(chat)
+
+                    if record and not completed:
+                        await in_thread(idempotency.save_progress)(record, reply_message_id=message.id)
+            finally:
+                if saved and completed:
+                    await in_thread(finish)({"chat_id": str(chat.id), "reply": reply}, 200)
+                else:
+                    await in_thread(finish)()
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@csrf_exempt
+@require_POST
+async def send_message(request):
+    user = await in_thread(get_user_from_request)(request)
+
+    if not user:
+        return error("Unauthorized", 401)
+
+    try:
+        data = json_body(request)
+    except ValueError:
+        return error("Invalid JSON body", 400)
+
+    if not data.get("message"):
+        return error("Message is required", 400)
+
+    response, finish, record = await in_thread(views.start_message)(request, user, data)
+
+    if finish is None:
+        return as_json(response)
+
+    response = None
+
+    try:
+        response = await reply_to_message(user, data, finish, record)
+        return response
+    finally:
+        # A streamed reply finishes when the stream ends
+        if response is None:
+            await in_thread(finish)()
+        elif not isinstance(response, StreamingHttpResponse):
+            await in_thread(finish)(json.loads(response.content), response.status_code)
+
+
+async def reply_to_message(user, data, finish, record=None):
+    """views.reply_to_message, with the chat and messages read and written asynchronously."""
+    message_text = data.get("message")
+    chat_id = data.get("chat_id")
+    use_cache = data.get("cache")
+    chats = collection(ChatSession)
+
+    if record and record.chat_id:
+        chat_id = record.chat_id
+
+    if chat_id:
+        try:
+            raw = await chats.find_one({"_id": ObjectId(chat_id), "user": user.id})
+        except InvalidId:
+            raw = None
+
+        if not raw:
+            return error("Chat not found", 404)
+
+        chat = ChatSession._from_son(raw)
+    else:
+        chat = await ainsert(ChatSession(user=user, title=message_text[:30]))
+
+    if record and not record.chat_id:
+        await in_thread(idempotency.save_progress)(record, chat_id=chat.id)
+
+    if record and record.reply_message_id:
+        await in_thread(delete_message)(chat, record.reply_message_id)
+        await in_thread(idempotency.save_progress)(record, reply_message_id=None)
+
+    if use_cache is not None and bool(use_cache) != chat.response_cache_enabled:
+        chat.response_cache_enabled = bool(use_cache)
+        await chats.update_one(
+            {"_id": chat.id},
+            {"$set": {"response_cache_enabled": chat.response_cache_enabled}}
+        )
+
+    if not (record and record.user_message_id):
+        message = await asave_message(chat, "user", message_text)
+
+        if record:
+            await in_thread(idempotency.save_progress)(record, user_message_id=message.id)
+
+    if data.get("async"):
+        job = await in_thread(enqueue_generation)(chat, user)
+        return JsonResponse({
+            "chat_id": str(chat.id),
+            "job_id": str(job.id),
+            "status": job.status
+        }, status=202)
+
+    conversation_history, whole_chat = await in_thread(build_conversation)(chat)
+    use_cache = chat.response_cache_enabled and whole_chat
+
+    if data.get("stream"):
+        return stream_reply(chat, conversation_history, finish, record, use_cache)
+
+    try:
+        ai_response = await agenerate_ai_response(conversation_history, use_cache=use_cache)
+    except UpstreamUnavailable as e:
+        return as_json(views.unavailable_response(e))
+    except Exception as e:
+        return error(str(e), 500)
+
+    if isinstance(ai_response, dict) and "error" in ai_response:
+        return JsonResponse(ai_response, status=500)
+
+    await asave_message(chat, "assistant", ai_response)
+    schedule_fold(chat)
+
+    return JsonResponse({
+        "chat_id": str(chat.id),
+        "reply": ai_response
+    })
+
+
+async def fetch_pexels_image(query):
+    url, kwargs = views.pexels_request(query)
+
+    response = await upstream("pexels").aget(url, **kwargs)
+    response.raise_for_status()
+
+    return views.parse_pexels_image(response.json())
+
+
+async def get_pexels_image(query):
+    try:
+        return await views.image_cache.aget_or_set(
+            f"pexels:{normalize_query(query)}",
+            lambda: fetch_pexels_image(query)
+        )
+    except Exception as e:
+        print("Pexels error:", e)
+        return None
+
+
+async def fetch_place_images(queries, deadline=None):
+    """views.fetch_place_images, with the lookups as tasks instead of pool threads."""
+    if not queries:
+        return []
+
+    if deadline is None:
+        deadline = settings.NEARBY_IMAGE_DEADLINE
+
+    tasks = [asyncio.ensure_future(get_pexels_image(query)) for query in queries]
+    done, _ = await asyncio.wait(tasks, timeout=deadline)
+
+    return [
+        (task.result() if task in done else None) or views.FALLBACK_IMAGE
+        for task in tasks
+    ]
+
+
+async def search_nearby_cell(cell):
+    url, kwargs = views.nearby_search_request(cell)
+
+    response = await upstream("tomtom").aget(url, **kwargs)
+    response.raise_for_status()
+
+    return views.parse_nearby_results(response.json())
+
+
+async def load_nearby_cell(cell):
+    """views.load_nearby_cell, with the TomTom search awaited."""
+    if not settings.PLACE_STORE_ENABLED:
+        return await search_nearby_cell(cell)
+
+    try:
+        if await in_thread(place_store.has_fresh_coverage)(cell):
+            center_lat, center_lon = geohash_center(cell)
+            return await in_thread(place_store.places_near)(
+                center_lat,
+                center_lon,
+                views.NEARBY_RADIUS_M + cell_half_diagonal_m(views.NEARBY_CELL_PRECISION),
+                settings.NEARBY_FETCH_LIMIT
+            )
+    except Exception as e:
+        print("Place store error:", e)
+
+    places = await search_nearby_cell(cell)
+
+    try:
+        await in_thread(place_store.store_places)(cell, places)
+    except Exception as e:
+        print("Place store error:", e)
+
+    return places
+
+
+async def get_nearby_candidates(lat, lon):
+    cell = geohash_encode(lat, lon, views.NEARBY_CELL_PRECISION)
+    return await views.nearby_cache.aget_or_set(cell, lambda: load_nearby_cell(cell))
+
+
+@csrf_exempt
+@require_POST
+async def nearby_places(request):
+    try:
+        lat, lon, limit, offset, max_distance_km = views.parse_nearby_request(json_body(request))
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        candidates = await get_nearby_candidates(lat, lon)
+    except UpstreamUnavailable as e:
+        return as_json(views.unavailable_response(e))
+    except Exception:
+        return error("TomTom API failed", 500)
+
+    page, results = views.nearby_results(lat, lon, candidates, limit, offset, max_distance_km)
+    missing, search_queries = views.missing_images(results)
+
+    if missing:
+        images = await fetch_place_images(search_queries)
+        await in_thread(views.apply_place_images)(page, results, missing, images)
+
+    return JsonResponse(results, safe=False)
+
+
+async def fetch_geocode(query):
+    url, kwargs = views.geocode_request(query)
+
+    response = await upstream("tomtom").aget(url, **kwargs)
+    response.raise_for_status()
+
+    return views.parse_geocode(response.json())
+
+
+async def fetch_reverse_geocode(lat, lon):
+    url, kwargs = views.reverse_geocode_request(lat, lon)
+
+    response = await upstream("tomtom").aget(url, **kwargs)
+    response.raise_for_status()
+
+    return views.parse_reverse_geocode(response.json())
+
+
+@csrf_exempt
+@require_POST
+async def geocode_location(request):
+    try:
+        query = json_body(request).get("query")
+    except ValueError:
+        return error("Invalid JSON body", 400)
+
+    if not query:
+        return error("Location query required", 400)
+
+    try:
+        location = await views.geocode_cache.aget_or_set(
+            normalize_query(query),
+            lambda: fetch_geocode(query)
+        )
+    except UpstreamUnavailable as e:
+        return as_json(views.unavailable_response(e))
+    except Exception as e:
+        print("TomTom error:", e)
+        return error("TomTom API failed", 500)
+
+    if not location:
+        return error("Location not found", 404)
+
+    return JsonResponse(location)
+
+
+@csrf_exempt
+@require_POST
+async def reverse_geocode(request):
+    try:
+        data = json_body(request)
+    except ValueError:
+        return error("Invalid JSON body", 400)
+
+    lat = data.get("latitude")
+    lon = data.get("longitude")
+
+    if lat is None or lon is None:
+        return error("Coordinates required", 400)
+
+    try:
+        precision = settings.REVERSE_GEOCODE_PRECISION
+        lat = round(float(lat), precision)
+        lon = round(float(lon), precision)
+    except (TypeError, ValueError):
+        return error("Invalid coordinates", 400)
+
+    try:
+        address = await views.reverse_geocode_cache.aget_or_set(
+            f"{lat:.{precision}f},{lon:.{precision}f}",
+            lambda: fetch_reverse_geocode(lat, lon)
+        )
+    except UpstreamUnavailable as e:
+        return as_json(views.unavailable_response(e))
+    except Exception as e:
+        print("TomTom error:", e)
+        return error("TomTom API failed", 500)
+
+    if not address:
+        return error("Location not found", 404)
+
+    return JsonResponse(address)
@@ -0,0 +1,273 @@
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from mongoengine.errors import NotUniqueError
+
+from core.cache import LRUCache, MISSING
+from core.metrics import register_collector
+from core.mongo import collection
+from core.singleflight import SingleFlight
+from .models import CacheEntry, CacheLock
+
+# Every TwoTierCache by namespace, so their counters can be reported together
+caches = {}
+
+
+def normalize_query(text):
+    """Lower-case and collapse whitespace so equivalent queries share a key."""
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+class TwoTierCache:
+    """
+    In-process LRU in front of the shared ``cache_entries`` Mongo collection.
+
+    Lookups try the local LRU first, then Mongo (so every worker benefits from
+    a value any worker fetched). ``None`` is cached too, as a negative result,
+    for the shorter ``negative_ttl``. Mongo errors are logged and treated as a
+    miss, so a cache outage never fails the request.
+
+    Concurrent misses for the same key in one process share a single load
+    (see core.singleflight). With CACHE_CROSS_WORKER_LOCKS, a short-lived
+    lock in ``cache_locks`` extends that across workers: the worker holding
+    it loads, the others wait for its value to appear in Mongo.
+
+    ``aget``/``aset``/``aget_or_set`` are the same for async views, reading
+    the Mongo tier through the async client (without single-flight).
+    """
+
+    def __init__(self, namespace, ttl, negative_ttl=None, maxsize=1024):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.flight = SingleFlight(namespace)
+        self.shared_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.collapsed_across_workers = 0
+        caches[namespace] = self
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key):
+        key = self._key(key)
+        value = self.local.get(key)
+
+        if value is MISSING:
+            value = self._get_shared(key)
+
+        if value is MISSING:
+            self.misses += 1
+        elif value is None:
+            self.negative_hits += 1
+
+        return value
+
+    def _get_shared(self, key):
+        try:
+            entry = CacheEntry.objects(key=key, expires_at__gt=datetime.utcnow()).first()
+        except Exception as e:
+            print("Cache read error:", e)
+            return MISSING
+
+        if entry is None:
+            return MISSING
+
+        self.shared_hits += 1
+        remaining = (entry.expires_at - datetime.utcnow()).total_seconds()
+        self.local.set(key, entry.value, ttl=max(remaining, 0))
+        return entry.value
+
+    def set(self, key, value):
+        key = self._key(key)
+        ttl = self.negative_ttl if value is None else self.ttl
+
+        self.local.set(key, value, ttl=ttl)
+
+        try:
+            CacheEntry.objects(key=key).update_one(
+                set__value=value,
+                set__expires_at=datetime.utcnow() + timedelta(seconds=ttl),
+                upsert=True
+            )
+        except Exception as e:
+            print("Cache write error:", e)
+
+    async def aget(self, key):
+        key = self._key(key)
+        value = self.local.get(key)
+
+        if value is MISSING:
+            value = await self._aget_shared(key)
+
+        if value is MISSING:
+            self.misses += 1
+        elif value is None:
+            self.negative_hits += 1
+
+        return value
+
+    async def _aget_shared(self, key):
+        try:
+            entry = await collection(CacheEntry).find_one(
+                {"_id": key, "expires_at": {"$gt": datetime.utcnow()}}
+            )
+        except Exception as e:
+            print("Cache read error:", e)
+            return MISSING
+
+        if entry is None:
+            return MISSING
+
+        self.shared_hits += 1
+        remaining = (entry["expires_at"] - datetime.utcnow()).total_seconds()
+        self.local.set(key, entry.get("value"), ttl=max(remaining, 0))
+        return entry.get("value")
+
+    async def aset(self, key, value):
+        key = self._key(key)
+        ttl = self.negative_ttl if value is None else self.ttl
+
+        self.local.set(key, value, ttl=ttl)
+
+        try:
+            await collection(CacheEntry).update_one(
+                {"_id": key},
+                {"$set": {"value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)}},
+                upsert=True
+            )
+        except Exception as e:
+            print("Cache write error:", e)
+
+    async def aget_or_set(self, key, loader):
+        """Like get_or_set, with ``loader`` a coroutine function."""
+        value = await self.aget(key)
+
+        if value is MISSING:
+            value = await loader()
+            await self.aset(key, value)
+
+        return value
+
+    def get_or_set(self, key, loader):
+        """
+        Return the cached value for ``key``, calling ``loader()`` on a miss.
+
+        Exceptions from ``loader`` propagate and nothing is cached, so
+        transient upstream failures are retried on the next call.
+        """
+        value = self.get(key)
+
+        if value is MISSING:
+            value = self.flight.do(key, lambda: self._load(key, loader))
+
+        return value
+
+    def _load(self, key, loader):
+        if not settings.CACHE_CROSS_WORKER_LOCKS:
+            return self._load_and_set(key, loader)
+
+        lock_key = self._key(key)
+        owner = uuid.uuid4().hex
+
+        if self._acquire_lock(lock_key, owner):
+            try:
+                return self._load_and_set(key, loader)
+            finally:
+                self._release_lock(lock_key, owner)
+
+        # Another worker is loading this key; wait for its value
+        deadline = time.monotonic() + settings.CACHE_LOCK_TTL
+
+        while time.monotonic() < deadline:
+            time.sleep(settings.CACHE_LOCK_POLL_INTERVAL)
+
+            value = self._get_shared(lock_key)
+
+            if value is not MISSING:
+                self.collapsed_across_workers += 1
+                return value
+
+            # Released without a value: its load failed, so try ourselves
+            if not CacheLock.objects(key=lock_key).first():
+                break
+
+        return self._load_and_set(key, loader)
+
+    def _load_and_set(self, key, loader):
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def _acquire_lock(self, lock_key, owner):
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=settings.CACHE_LOCK_TTL)
+
+        try:
+            CacheLock(key=lock_key, owner=owner, expires_at=expires_at).save(force_insert=True)
+            return True
+        except NotUniqueError:
+            # Take over a lock whose holder died; Mongo's TTL monitor only
+            # removes expired documents about once a minute
+            return bool(CacheLock.objects(key=lock_key, expires_at__lt=now).update_one(
+                set__owner=owner,
+                set__expires_at=expires_at
+            ))
+        except Exception as e:
+            print("Cache lock error:", e)
+            return True
+
+    def _release_lock(self, lock_key, owner):
+        try:
+            CacheLock.objects(key=lock_key, owner=owner).delete()
+        except Exception as e:
+            print("Cache lock error:", e)
+
+    def delete(self, key):
+        key = self._key(key)
+        self.local.delete(key)
+
+        try:
+            CacheEntry.objects(key=key).delete()
+        except Exception as e:
+            print("Cache delete error:", e)
+
+    def stats(self):
+        hits = self.local.hits + self.shared_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "local_hits": self.local.hits,
+            "shared_hits": self.shared_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "collapsed": self.flight.collapsed,
+            "collapsed_across_workers": self.collapsed_across_workers,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "size": len(self.local),
+        }
+
+
+def cache_stats():
+    return {namespace: cache.stats() for namespace, cache in caches.items()}
+
+
+def render_cache_metrics():
+    lines = [
+        "# HELP cache_lookups_total Cache lookups, by cache and result.",
+        "# TYPE cache_lookups_total counter",
+    ]
+
+    for namespace, stats in cache_stats().items():
+        for result in ("local_hits", "shared_hits", "misses", "collapsed", "collapsed_across_workers"):
+            lines.append(f'cache_lookups_total{{cache="{namespace}",result="{result}"}} {stats[result]}')
+
+    return lines
+
+
+register_collector(render_cache_metrics)
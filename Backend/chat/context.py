@@ -0,0 +1,166 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .models import ChatSession, Message
+from .gemini_service import SYSTEM_PROMPT, summarize_conversation
+
+# Chats being folded (or queued to be) in this process, so concurrent turns
+# fold them once
+_folding = set()
+_folding_lock = threading.Lock()
+
+# Shared across requests so the number of concurrent summary calls stays bounded
+fold_pool = ThreadPoolExecutor(
+    max_workers=settings.CONTEXT_FOLD_WORKERS,
+    thread_name_prefix="summary-folds"
+)
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English, plus per-message overhead
+    return len(text) // 4 + 4
+
+
+def history_tokens(history):
+    return sum(estimate_tokens(m["content"]) for m in history)
+
+
+def fallback_summary(previous_summary, messages):
+    """Cheap extractive summary, used when the LLM summary call fails."""
+    lines = [previous_summary] if previous_summary else []
+    lines += [f"{m['role']}: {m['content'][:200]}" for m in messages]
+    max_chars = settings.CONTEXT_SUMMARY_MAX_TOKENS * 4
+    return "\n".join(lines)[-max_chars:]
+
+
+def fold_into_summary(chat, messages):
+    """Fold ``messages`` (oldest first) into the chat's summary and move the watermark."""
+    history = [{"role": m.role, "content": m.content} for m in messages]
+    max_words = settings.CONTEXT_SUMMARY_MAX_TOKENS * 3 // 4
+
+    try:
+        summary = summarize_conversation(chat.summary, history, max_words=max_words)
+    except Exception as e:
+        print("Summary error:", e)
+        summary = fallback_summary(chat.summary, history)
+
+    chat.summary = summary
+    chat.summary_until = messages[-1].created_at
+
+    ChatSession.objects(id=chat.id).update_one(
+        set__summary=chat.summary,
+        set__summary_until=chat.summary_until
+    )
+
+
+def unsummarized_messages(chat):
+    """The chat's messages newer than its summary watermark, oldest first."""
+    query = Message.objects(chat=chat)
+
+    if chat.summary_until:
+        query = query.filter(created_at__gt=chat.summary_until)
+
+    return list(query.only("role", "content", "created_at").order_by("created_at"))
+
+
+def build_conversation(chat):
+    """
+    Build the message list sent to the LLM for ``chat``.
+
+    Only messages newer than the summary watermark are read. They are sent
+    verbatim after the chat's summary, dropping the oldest if they do not
+    fit in CONTEXT_TOKEN_BUDGET; folding them into the summary is left to
+    fold_if_due, after the reply, so the summary call never delays one.
+
+    Returns the message list and whether it is the whole chat verbatim (no
+    summary, nothing dropped), which a reply must be to be shared through
+    the response cache.
+    """
+    return conversation_from(chat, unsummarized_messages(chat))
+
+
+def conversation_from(chat, messages):
+    """build_conversation for the unsummarized ``messages`` already in memory."""
+    budget = settings.CONTEXT_TOKEN_BUDGET - estimate_tokens(SYSTEM_PROMPT)
+    verbatim = [{"role": m.role, "content": m.content} for m in messages]
+    history = []
+
+    if chat.summary:
+        history.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation:\n{chat.summary}"
+        })
+
+    # Drop the oldest messages that do not fit, but always keep the message
+    # being answered
+    while len(verbatim) > 1 and history_tokens(history + verbatim) > budget:
+        verbatim.pop(0)
+
+    whole_chat = chat.summary_until is None and len(verbatim) == len(messages)
+    return history + verbatim, whole_chat
+
+
+def fold_messages(chat, messages):
+    """
+    Fold the older of ``messages`` into the chat summary if it is due, and
+    return the ones still unsummarized.
+
+    The last CONTEXT_KEEP_TURNS turns are always kept verbatim; older ones
+    are folded in batches of CONTEXT_SUMMARY_BATCH messages (or sooner, if
+    they no longer fit in CONTEXT_TOKEN_BUDGET), so the summary call is not
+    paid on every turn.
+    """
+    keep = settings.CONTEXT_KEEP_TURNS * 2
+    # messages[:-0] would be empty, not everything
+    older = messages[:-keep] if keep else messages
+
+    budget = settings.CONTEXT_TOKEN_BUDGET - estimate_tokens(SYSTEM_PROMPT)
+    summary_budget = estimate_tokens(chat.summary) if chat.summary else 0
+    verbatim = [{"role": m.role, "content": m.content} for m in messages]
+
+    if older and (
+        len(older) >= settings.CONTEXT_SUMMARY_BATCH
+        or history_tokens(verbatim) + summary_budget > budget
+    ):
+        fold_into_summary(chat, older)
+        return messages[len(older):]
+
+    return messages
+
+
+def _claim_fold(chat_id):
+    """Mark ``chat_id`` as being folded; False if it already is."""
+    with _folding_lock:
+        if chat_id in _folding:
+            return False
+        _folding.add(chat_id)
+        return True
+
+
+def _fold_claimed(chat_id):
+    try:
+        # Read afresh: another worker may have moved the watermark since the
+        # caller loaded the chat, and the caller's copy is left alone
+        chat = ChatSession.objects(id=chat_id).only("summary", "summary_until").first()
+
+        if chat:
+            fold_messages(chat, unsummarized_messages(chat))
+    except Exception as e:
+        print("Summary error:", e)
+    finally:
+        with _folding_lock:
+            _folding.discard(chat_id)
+
+
+def fold_if_due(chat):
+    """fold_messages for ``chat``, reading its unsummarized messages."""
+    if _claim_fold(chat.id):
+        _fold_claimed(chat.id)
+
+
+def schedule_fold(chat):
+    """Run fold_if_due for ``chat`` on fold_pool, once the reply is saved."""
+    if _claim_fold(chat.id):
+        fold_pool.submit(_fold_claimed, chat.id)
@@ -0,0 +1,161 @@
+import json
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from .messages import record_activity
+from .models import ChatSession, Message
+
+# Only what an export contains is read from Mongo
+CHAT_FIELDS = {"title": 1, "created_at": 1}
+MESSAGE_FIELDS = {"_id": 0, "role": 1, "content": 1, "created_at": 1}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _line(record):
+    return json.dumps(record, ensure_ascii=False, default=_json_default) + "\n"
+
+
+def export_lines(user, chat_id=None, batch_size=None):
+    """
+    Yield NDJSON lines for one chat, or all of ``user``'s chats, oldest first.
+
+    Each chat is a ``{"type": "chat", ...}`` line followed by one
+    ``{"type": "message", ...}`` line per message. Both collections are read
+    through cursors in batches of ``batch_size``, so memory use does not
+    grow with the length of a chat.
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+
+    query = {"user": user.id}
+
+    if chat_id is not None:
+        query["_id"] = chat_id
+
+    chats = ChatSession._get_collection().find(query, CHAT_FIELDS)
+    chats = chats.sort([("created_at", 1), ("_id", 1)]).batch_size(batch_size)
+
+    for chat in chats:
+        exported_id = str(chat["_id"])
+
+        yield _line({
+            "type": "chat",
+            "chat_id": exported_id,
+            "title": chat.get("title"),
+            "created_at": chat.get("created_at")
+        })
+
+        messages = Message._get_collection().find({"chat": chat["_id"]}, MESSAGE_FIELDS)
+        messages = messages.sort([("created_at", 1), ("_id", 1)]).batch_size(batch_size)
+
+        for message in messages:
+            yield _line({
+                "type": "message",
+                "chat_id": exported_id,
+                "role": message["role"],
+                "content": message["content"],
+                "created_at": message.get("created_at")
+            })
+
+
+def import_lines(user, lines, batch_size=None):
+    """
+    Import NDJSON produced by export_lines as new chats owned by ``user``.
+
+    Chats get new ids; messages are written with batched ``insert_many``,
+    and each chat's activity fields are set once its messages are in.
+    Returns ``(chats, messages)`` counts. Raises ValueError on a malformed
+    line, a message before its chat, or an unknown role.
+    """
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    collection = Message._get_collection()
+
+    chat_ids = {}
+    # Per new chat id: [message count, newest message]
+    activity = {}
+    batch = []
+    message_count = 0
+
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+
+        if not line.strip():
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Line {number}: invalid JSON")
+
+        created_at = _parse_datetime(record.get("created_at"), number)
+
+        if record.get("type") == "chat":
+            chat = ChatSession(user=user, title=record.get("title"))
+
+            if created_at:
+                chat.created_at = created_at
+                chat.updated_at = created_at
+
+            chat.save()
+            chat_ids[record.get("chat_id")] = chat.id
+            activity[chat.id] = [0, None]
+
+        elif record.get("type") == "message":
+            if record.get("chat_id") not in chat_ids:
+                raise ValueError(f"Line {number}: message for unknown chat {record.get('chat_id')}")
+
+            if record.get("role") not in ("user", "assistant") or not record.get("content"):
+                raise ValueError(f"Line {number}: invalid message")
+
+            message = {
+                "chat": chat_ids[record["chat_id"]],
+                "role": record["role"],
+                "content": record["content"],
+                "created_at": created_at or datetime.utcnow()
+            }
+            batch.append(message)
+
+            chat_activity = activity[message["chat"]]
+            chat_activity[0] += 1
+            if chat_activity[1] is None or message["created_at"] >= chat_activity[1]["created_at"]:
+                chat_activity[1] = message
+
+            if len(batch) >= batch_size:
+                collection.insert_many(batch, ordered=False)
+                message_count += len(batch)
+                batch = []
+
+        else:
+            raise ValueError(f"Line {number}: unknown record type {record.get('type')!r}")
+
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        message_count += len(batch)
+
+    for chat_id, (count, last) in activity.items():
+        if last:
+            record_activity(chat_id, count, last["content"], last["created_at"])
+
+    return len(chat_ids), message_count
+
+
+def _parse_datetime(value, number):
+    if not value:
+        return None
+
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Line {number}: invalid created_at")
+
+    # Stored naive in UTC, like the rest of the app's datetimes
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return parsed
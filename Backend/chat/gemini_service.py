@@ -1,18 +1,26 @@
-import requests
+import hashlib
+import json
+import time
 from django.conf import settings
 
+from core.cache import MISSING
+from core.metrics import observe_llm, LLM_FIRST_TOKEN_SECONDS
+from .cache import TwoTierCache, normalize_query
+from .upstream import upstream
+
 HF_MODEL = "meta-llama/Meta-Llama-3-8B-Instruct"
+HF_MAX_TOKENS = 1500
+HF_TEMPERATURE = 0.6
 
-def generate_ai_response(conversation_messages):
+# Last line of a streamed completion
+STREAM_DONE = "[DONE]"
+STREAM_CUT_OFF = "HF stream ended before the reply was complete"
 
-    url = "https://router.huggingface.co/v1/chat/completions"
+# Finish reasons of a reply that may be cached: not "length" (cut off at
+# max_tokens); some servers send none
+CACHEABLE_FINISH_REASONS = (None, "stop")
 
-    headers = {
-        "Authorization": f"Bearer {settings.HF_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    system_prompt = """
+SYSTEM_PROMPT = """
 You are a professional AI travel planner.
 
 Always use previous conversation context to understand the destination.
@@ -58,8 +66,68 @@ Do not use bold formatting.
 Do not ask for duration or budget again if already provided earlier in the conversation.
 Use conversation memory intelligently.
 """
+
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a traveller and an AI travel planner.
+
+Update the existing summary with the new messages. Keep destinations, dates,
+duration, budget, group size, preferences and any plans or decisions already made.
+Drop greetings and repetition. Write plain sentences, at most {max_words} words.
+"""
+
+
+# Replies to short (by default single-turn) conversations, which are often
+# near-identical first requests like "3 day trip to Goa under 20000"
+response_cache = TwoTierCache(
+    "responses",
+    ttl=settings.RESPONSE_CACHE_TTL,
+    maxsize=settings.RESPONSE_CACHE_SIZE
+)
+
+
+def response_cache_key(conversation_messages):
+    """Hash of everything that determines the reply, with message text normalized."""
+    raw = json.dumps({
+        "model": HF_MODEL,
+        "system": SYSTEM_PROMPT,
+        "temperature": HF_TEMPERATURE,
+        "max_tokens": HF_MAX_TOKENS,
+        "messages": [
+            {"role": m["role"], "content": normalize_query(m["content"])}
+            for m in conversation_messages
+        ]
+    }, sort_keys=True)
+
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def get_cache_key(conversation_messages, use_cache):
+    """
+    Cache key for the conversation, or None if its reply should not be cached.
+
+    Callers pass ``use_cache`` only for a whole chat (see build_conversation):
+    the turn count of a trimmed history says nothing about the chat's.
+    """
+    if not use_cache or not settings.RESPONSE_CACHE_ENABLED:
+        return None
+
+    # Anything beyond plain user/assistant turns (e.g. a chat summary) is
+    # specific to one chat and would never be shared
+    if any(m["role"] not in ("user", "assistant") for m in conversation_messages):
+        return None
+
+    user_turns = sum(1 for m in conversation_messages if m["role"] == "user")
+
+    if user_turns > settings.RESPONSE_CACHE_MAX_TURNS:
+        return None
+
+    return response_cache_key(conversation_messages)
+
+
+def build_payload(conversation_messages, stream=False):
     # Add system message at top
-    messages = [{"role": "system", "content": system_prompt}] + conversation_messages
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}] + conversation_messages
 
     # ✅ ADD DEBUG HERE
     print("====== FULL MESSAGE PAYLOAD ======")
@@ -67,19 +135,288 @@ Use conversation memory intelligently.
         print(m["role"], ":", m["content"][:80])
     print("===================================")
 
-
     payload = {
         "model": HF_MODEL,
         "messages": messages,
-        "max_tokens": 1500,
-        "temperature": 0.6
+        "max_tokens": HF_MAX_TOKENS,
+        "temperature": HF_TEMPERATURE
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    if stream:
+        payload["stream"] = True
+        # Ask for token usage in the final chunk
+        payload["stream_options"] = {"include_usage": True}
+
+    return payload
+
+
+def get_headers():
+    return {
+        "Authorization": f"Bearer {settings.HF_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+
+def read_reply(data, started):
+    """The reply text of a completion response, recording its timing and usage."""
+    usage = data.get("usage") or {}
+    observe_llm(
+        "reply",
+        time.perf_counter() - started,
+        usage.get("prompt_tokens"),
+        usage.get("completion_tokens")
+    )
+
+    return data["choices"][0]["message"]["content"]
+
+
+def parse_stream_line(line):
+    """
+    The JSON chunk carried by one line of a streamed completion.
+
+    Returns STREAM_DONE for the final ``data: [DONE]`` and None for lines
+    that carry no data (blank lines, comments).
+    """
+    if not line or not line.startswith("data:"):
+        return None
+
+    data = line[len("data:"):].strip()
+
+    if data == STREAM_DONE:
+        return STREAM_DONE
+
+    return json.loads(data)
+
+
+def chunk_token(chunk):
+    choices = chunk.get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content")
+
+
+def chunk_finish_reason(chunk):
+    choices = chunk.get("choices") or [{}]
+    return choices[0].get("finish_reason")
+
+
+def observe_stream(started, usage, tokens):
+    if tokens:
+        observe_llm(
+            "stream",
+            time.perf_counter() - started,
+            usage.get("prompt_tokens"),
+            # Without usage, each chunk is roughly one token
+            usage.get("completion_tokens") or len(tokens)
+        )
+
+
+def generate_ai_response(conversation_messages, use_cache=True):
+    cache_key = get_cache_key(conversation_messages, use_cache)
+
+    if cache_key:
+        cached = response_cache.get(cache_key)
+
+        if cached is not MISSING:
+            return cached
+
+    payload = build_payload(conversation_messages)
+
+    started = time.perf_counter()
+    response = upstream("hf").post(settings.HF_API_URL, headers=get_headers(), json=payload)
 
     if response.status_code != 200:
-            return data.get("choices", [{}])[0].get("message", {}).get("content", "")
-    
+        return {"error": f"HF API failed with status {response.status_code}"}
+
+    reply = read_reply(response.json(), started)
+
+    if cache_key:
+        response_cache.set(cache_key, reply)
+
+    return reply
+
+
+async def agenerate_ai_response(conversation_messages, use_cache=True):
+    """generate_ai_response for async views."""
+    cache_key = get_cache_key(conversation_messages, use_cache)
+
+    if cache_key:
+        cached = await response_cache.aget(cache_key)
+
+        if cached is not MISSING:
+            return cached
+
+    payload = build_payload(conversation_messages)
+
+    started = time.perf_counter()
+    response = await upstream("hf").apost(settings.HF_API_URL, headers=get_headers(), json=payload)
+
+    if response.status_code != 200:
+        return {"error": f"HF API failed with status {response.status_code}"}
+
+    reply = read_reply(response.json(), started)
+
+    if cache_key:
+        await response_cache.aset(cache_key, reply)
+
+    return reply
+
+
+def stream_ai_response(conversation_messages, use_cache=True):
+    """
+    Yield the assistant reply piece by piece as HF produces it.
+
+    The router speaks OpenAI-style Server-Sent Events: one ``data: {...}``
+    line per chunk and a final ``data: [DONE]``. A cached reply is yielded
+    in one piece; a streamed one is cached only if it ran to completion:
+    the ``[DONE]`` line arrived and the reply did not stop for another
+    reason than finishing (e.g. ``max_tokens``). A body that ends without
+    ``[DONE]`` raises RuntimeError after its tokens, like a failed request.
+    """
+    cache_key = get_cache_key(conversation_messages, use_cache)
+
+    if cache_key:
+        cached = response_cache.get(cache_key)
+
+        if cached is not MISSING:
+            yield cached
+            return
+
+    payload = build_payload(conversation_messages, stream=True)
+
+    started = time.perf_counter()
+    response = upstream("hf").post(
+        settings.HF_API_URL,
+        headers=get_headers(),
+        json=payload,
+        stream=True
+    )
+
+    tokens = []
+    usage = {}
+    done = False
+    finish_reason = None
+
+    try:
+        if response.status_code != 200:
+            raise RuntimeError(f"HF API failed with status {response.status_code}")
+
+        for line in response.iter_lines(decode_unicode=True):
+            chunk = parse_stream_line(line)
+
+            if chunk is None:
+                continue
+            if chunk == STREAM_DONE:
+                done = True
+                break
+
+            usage = chunk.get("usage") or usage
+            finish_reason = chunk_finish_reason(chunk) or finish_reason
+            token = chunk_token(chunk)
+
+            if token:
+                if not tokens:
+                    LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                tokens.append(token)
+                yield token
+
+        # A body that ends without [DONE] was cut off, not finished
+        if not done:
+            raise RuntimeError(STREAM_CUT_OFF)
+
+        if cache_key and tokens and finish_reason in CACHEABLE_FINISH_REASONS:
+            response_cache.set(cache_key, "".join(tokens))
+    finally:
+        response.close()
+        observe_stream(started, usage, tokens)
+
+
+async def astream_ai_response(conversation_messages, use_cache=True):
+    """stream_ai_response for async views, as an async generator."""
+    cache_key = get_cache_key(conversation_messages, use_cache)
+
+    if cache_key:
+        cached = await response_cache.aget(cache_key)
+
+        if cached is not MISSING:
+            yield cached
+            return
+
+    payload = build_payload(conversation_messages, stream=True)
+
+    started = time.perf_counter()
+    response = await upstream("hf").apost(
+        settings.HF_API_URL,
+        headers=get_headers(),
+        json=payload,
+        stream=True
+    )
+
+    tokens = []
+    usage = {}
+    done = False
+    finish_reason = None
+
+    try:
+        if response.status_code != 200:
+            raise RuntimeError(f"HF API failed with status {response.status_code}")
+
+        async for line in response.aiter_lines():
+            chunk = parse_stream_line(line)
+
+            if chunk is None:
+                continue
+            if chunk == STREAM_DONE:
+                done = True
+                break
+
+            usage = chunk.get("usage") or usage
+            finish_reason = chunk_finish_reason(chunk) or finish_reason
+            token = chunk_token(chunk)
+
+            if token:
+                if not tokens:
+                    LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                tokens.append(token)
+                yield token
+
+        if not done:
+            raise RuntimeError(STREAM_CUT_OFF)
+
+        if cache_key and tokens and finish_reason in CACHEABLE_FINISH_REASONS:
+            await response_cache.aset(cache_key, "".join(tokens))
+    finally:
+        await response.aclose()
+        observe_stream(started, usage, tokens)
+
+
+def summarize_conversation(previous_summary, conversation_messages, max_words=200):
+    """Fold ``conversation_messages`` into ``previous_summary`` and return the new summary."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in conversation_messages)
+
+    payload = {
+        "model": HF_MODEL,
+        "messages": [
+            {"role": "system", "content": SUMMARY_PROMPT.format(max_words=max_words)},
+            {
+                "role": "user",
+                "content": f"Existing summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+            }
+        ],
+        "max_tokens": max_words * 2,
+        "temperature": 0.2
+    }
+
+    started = time.perf_counter()
+    response = upstream("hf").post(settings.HF_API_URL, headers=get_headers(), json=payload)
+    response.raise_for_status()
 
     data = response.json()
-    return data["choices"][0]["message"]["content"]
+
+    usage = data.get("usage") or {}
+    observe_llm(
+        "summary",
+        time.perf_counter() - started,
+        usage.get("prompt_tokens"),
+        usage.get("completion_tokens")
+    )
+
+    return data["choices"][0]["message"]["content"].strip()
@@ -0,0 +1,120 @@
+import math
+
+import numpy as np
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def geohash_encode(lat, lon, precision):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if lon >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def geohash_bbox(geohash):
+    """Return ``(lat_min, lat_max, lon_min, lon_max)`` of a geohash cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        value = BASE32.index(char)
+
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+
+            if bit:
+                target[0] = mid
+            else:
+                target[1] = mid
+
+            even = not even
+
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def geohash_center(geohash):
+    lat_min, lat_max, lon_min, lon_max = geohash_bbox(geohash)
+    return (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+
+
+def cell_size_m(precision):
+    """Width and height in metres of a geohash cell at the equator (its widest)."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    width = 360 / 2 ** lon_bits * METERS_PER_DEGREE
+    height = 180 / 2 ** lat_bits * METERS_PER_DEGREE
+    return width, height
+
+
+def cell_half_diagonal_m(precision):
+    width, height = cell_size_m(precision)
+    return math.hypot(width, height) / 2
+
+
+def precision_for_radius(radius_m):
+    """
+    Coarsest geohash precision whose cells are no wider than ``radius_m``.
+
+    Large cells let more nearby callers share one cached search, while
+    keeping the extra search radius needed to cover the whole cell small.
+    """
+    precision = 1
+
+    while max(cell_size_m(precision)) > radius_m and precision < 12:
+        precision += 1
+
+    return precision
+
+
+def haversine_km(lat, lon, lats, lons):
+    """
+    Great-circle distances in km from one point to arrays of points.
+
+    Vectorized counterpart of views.calculate_distance (unrounded), so a
+    whole candidate set is measured in one pass.
+    """
+    lat1 = math.radians(lat)
+    lats = np.radians(np.asarray(lats, dtype=float))
+    dlat = lats - lat1
+    dlon = np.radians(np.asarray(lons, dtype=float) - lon)
+
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lats) * np.sin(dlon / 2) ** 2
+
+    return 2 * EARTH_RADIUS_M / 1000 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
@@ -0,0 +1,126 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from mongoengine.errors import NotUniqueError
+
+from .models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyMismatch(Exception):
+    """The key was already used for a different request."""
+
+
+def fingerprint(data):
+    """Hash of the fields that make two send_message requests the same request."""
+    raw = json.dumps(
+        {"message": data.get("message"), "chat_id": data.get("chat_id")},
+        sort_keys=True
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def claim(user, key, request_fingerprint):
+    """
+    Return ``(record, leader)`` for an Idempotency-Key sent by ``user``.
+
+    The first request with a key is the leader and must later call
+    complete() or abandon(), and renew() the lease while it streams. Later
+    requests get the existing record, which may still be pending; a pending
+    record whose lease ran out (crashed worker, or a leader that abandoned
+    it after saving some messages) is taken over, along with what the
+    previous leader recorded with save_progress(). Raises
+    IdempotencyMismatch if the key was used for a different request.
+    """
+    record_id = f"{user.id}:{key}"
+    now = datetime.utcnow()
+
+    record = IdempotencyKey(
+        key=record_id,
+        fingerprint=request_fingerprint,
+        locked_until=now + timedelta(seconds=settings.IDEMPOTENCY_LEASE),
+        expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    )
+
+    try:
+        record.save(force_insert=True)
+        return record, True
+    except NotUniqueError:
+        pass
+
+    existing = IdempotencyKey.objects(key=record_id).first()
+
+    if existing is None:
+        # Expired or abandoned in between; start over
+        return claim(user, key, request_fingerprint)
+
+    if existing.fingerprint != request_fingerprint:
+        raise IdempotencyMismatch("Idempotency-Key was already used for a different request")
+
+    if existing.status == "pending" and existing.locked_until <= now:
+        taken = IdempotencyKey.objects(
+            key=record_id,
+            status="pending",
+            locked_until=existing.locked_until
+        ).modify(
+            new=True,
+            set__locked_until=now + timedelta(seconds=settings.IDEMPOTENCY_LEASE)
+        )
+
+        if taken:
+            return taken, True
+
+    return existing, False
+
+
+def save_progress(record, **fields):
+    """Record ``chat_id``, ``user_message_id`` or ``reply_message_id`` for a retry to reuse."""
+    for name, value in fields.items():
+        setattr(record, name, value)
+
+    IdempotencyKey.objects(key=record.key).update_one(
+        **{f"set__{name}": value for name, value in fields.items()}
+    )
+
+
+def renewal_due(record):
+    """Whether half of the leader's lease on ``record`` has run out."""
+    left = record.locked_until - datetime.utcnow()
+    return left < timedelta(seconds=settings.IDEMPOTENCY_LEASE / 2)
+
+
+def renew(record):
+    """Extend the leader's lease, so a long stream is not taken over by a retry."""
+    record.locked_until = datetime.utcnow() + timedelta(seconds=settings.IDEMPOTENCY_LEASE)
+
+    IdempotencyKey.objects(key=record.key, status="pending").update_one(
+        set__locked_until=record.locked_until
+    )
+
+
+def complete(record, data, status_code):
+    """Store the leader's response so retries can be answered with it."""
+    IdempotencyKey.objects(key=record.key).update_one(
+        set__status="done",
+        set__response=data,
+        set__status_code=status_code
+    )
+
+
+def abandon(record):
+    """
+    Give up a key whose request failed, so a retry runs it again.
+
+    A key with saved progress is kept, with its lease ended, so the retry
+    takes it over instead of saving the user's message a second time.
+    """
+    if record.chat_id is None:
+        IdempotencyKey.objects(key=record.key, status="pending").delete()
+        return
+
+    IdempotencyKey.objects(key=record.key, status="pending").update_one(
+        set__locked_until=datetime.utcnow()
+    )
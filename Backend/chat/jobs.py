@@ -0,0 +1,117 @@
+import threading
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from mongoengine.queryset.visitor import Q
+
+from .models import GenerationJob
+from .messages import save_message
+from .context import build_conversation, fold_if_due
+from .gemini_service import generate_ai_response
+
+# Set whenever a job is enqueued in this process, so idle workers wake at once
+# instead of waiting for their next poll
+job_available = threading.Event()
+
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def enqueue_generation(chat, user):
+    """Queue generation of the next assistant reply in ``chat`` and return the job."""
+    job = GenerationJob(chat=chat, user=user)
+    job.save()
+
+    start_workers(settings.GENERATION_WORKERS)
+    job_available.set()
+
+    return job
+
+
+def claim_next_job():
+    """
+    Atomically take the oldest queued job (or one whose worker lost its lease).
+
+    find_one_and_update guarantees each job is claimed by exactly one worker,
+    even across processes.
+    """
+    now = datetime.utcnow()
+
+    return GenerationJob.objects(
+        Q(status="queued") | Q(status="running", lease_expires_at__lt=now)
+    ).order_by("created_at").modify(
+        new=True,
+        set__status="running",
+        set__started_at=now,
+        set__lease_expires_at=now + timedelta(seconds=settings.GENERATION_JOB_LEASE),
+        inc__attempts=1
+    )
+
+
+def finish_job(job, reply=None, error=None):
+    GenerationJob.objects(id=job.id).update_one(
+        set__status="failed" if error else "done",
+        set__reply=reply,
+        set__error=error,
+        set__finished_at=datetime.utcnow()
+    )
+
+
+def run_job(job):
+    if job.attempts > settings.GENERATION_JOB_MAX_ATTEMPTS:
+        finish_job(job, error="Generation did not complete")
+        return
+
+    try:
+        chat = job.chat
+        conversation_history, whole_chat = build_conversation(chat)
+        ai_response = generate_ai_response(
+            conversation_history,
+            use_cache=chat.response_cache_enabled and whole_chat
+        )
+    except Exception as e:
+        finish_job(job, error=str(e))
+        return
+
+    if isinstance(ai_response, dict) and "error" in ai_response:
+        finish_job(job, error=ai_response["error"])
+        return
+
+    ai_msg = save_message(chat, "assistant", ai_response)
+
+    finish_job(job, reply=ai_msg)
+
+    # Already off the request path; the client has its reply by now
+    fold_if_due(chat)
+
+
+def worker_loop(stop_event=None):
+    while not (stop_event and stop_event.is_set()):
+        try:
+            job = claim_next_job()
+        except Exception as e:
+            print("Job queue error:", e)
+            job = None
+
+        if job is None:
+            job_available.wait(settings.GENERATION_POLL_INTERVAL)
+            job_available.clear()
+            continue
+
+        try:
+            run_job(job)
+        except Exception as e:
+            print("Generation job error:", e)
+
+
+def start_workers(count):
+    """Start ``count`` worker threads in this process, once."""
+    with _workers_lock:
+        while len(_workers) < count:
+            worker = threading.Thread(
+                target=worker_loop,
+                name=f"generation-worker-{len(_workers)}",
+                daemon=True
+            )
+            worker.start()
+            _workers.append(worker)
@@ -0,0 +1,109 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from chat.messages import preview
+from chat.models import ChatSession, Message
+
+
+def chat_activity(chat_ids):
+    """Message count and newest message per chat, for the given chat ids."""
+    pipeline = [
+        {"$match": {"chat": {"$in": chat_ids}}},
+        {"$sort": {"chat": 1, "created_at": 1, "_id": 1}},
+        {"$group": {
+            "_id": "$chat",
+            "count": {"$sum": 1},
+            "last_content": {"$last": "$content"},
+            "last_at": {"$last": "$created_at"}
+        }}
+    ]
+
+    return {row["_id"]: row for row in Message._get_collection().aggregate(pipeline)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute message_count, last_message_preview and updated_at on chats "
+        "from their messages, e.g. for chats created before those fields were "
+        "maintained. Safe to run while the app is serving."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--missing-only",
+            action="store_true",
+            help=(
+                "Only write chats whose stored fields are missing or whose "
+                "message_count is below their real count."
+            )
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Chats per aggregate and bulk write (default: 500)."
+        )
+
+    def handle(self, *args, **options):
+        chats = ChatSession._get_collection()
+
+        # Every chat is read even with --missing-only: an older chat that got
+        # a message since the fields were added has them all set, but its
+        # message_count only counts the new messages
+        cursor = chats.find({}, {"created_at": 1, "updated_at": 1, "message_count": 1}).batch_size(
+            options["batch_size"]
+        )
+
+        updated = skipped = 0
+        batch = []
+
+        for chat in cursor:
+            batch.append(chat)
+
+            if len(batch) >= options["batch_size"]:
+                done, tried = self.backfill(chats, batch, options["missing_only"])
+                updated, skipped = updated + done, skipped + tried - done
+                batch = []
+
+        if batch:
+            done, tried = self.backfill(chats, batch, options["missing_only"])
+            updated, skipped = updated + done, skipped + tried - done
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {updated} chats"))
+
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"{skipped} chats changed or were deleted during the run; run again to recompute them"
+            ))
+
+    def backfill(self, chats, batch, missing_only=False):
+        """Recompute ``batch``; return how many chats were updated, and how many were tried."""
+        activity = chat_activity([chat["_id"] for chat in batch])
+        requests = []
+
+        for chat in batch:
+            row = activity.get(chat["_id"])
+
+            if row:
+                fields = {
+                    "message_count": row["count"],
+                    "last_message_preview": preview(row["last_content"]),
+                    "updated_at": row["last_at"]
+                }
+            else:
+                fields = {"message_count": 0, "updated_at": chat.get("created_at")}
+
+            if missing_only and chat.get("updated_at") and chat.get("message_count", -1) >= fields["message_count"]:
+                continue
+
+            # A message written since the chat was read would be lost from
+            # the count, so skip any chat whose updated_at has moved
+            requests.append(UpdateOne(
+                {"_id": chat["_id"], "updated_at": chat.get("updated_at")},
+                {"$set": fields}
+            ))
+
+        if not requests:
+            return 0, 0
+
+        return chats.bulk_write(requests, ordered=False).matched_count, len(requests)
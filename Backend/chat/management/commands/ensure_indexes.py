@@ -0,0 +1,101 @@
+from bson import ObjectId
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.models import (
+    ChatSession, Message, CacheEntry, CacheLock, Place, PlaceCoverage, GenerationJob,
+    AdmissionBucket, AdmissionSlot, IdempotencyKey
+)
+from users.models import User
+
+DOCUMENTS = [
+    User, ChatSession, Message, CacheEntry, CacheLock, Place, PlaceCoverage, GenerationJob,
+    AdmissionBucket, AdmissionSlot, IdempotencyKey
+]
+
+# Stages that mean a query is scanning the collection or sorting in memory
+BAD_STAGES = {"COLLSCAN", "SORT"}
+
+
+def hot_queries():
+    """The queries every chat request runs, built with placeholder ids."""
+    user_id = ObjectId()
+    chat_id = ObjectId()
+
+    return {
+        "chat history": Message.objects(chat=chat_id).order_by("created_at", "id"),
+        "latest messages": Message.objects(chat=chat_id).order_by("-created_at", "-id"),
+        "context since summary": Message.objects(
+            chat=chat_id, created_at__gt=datetime.utcnow()
+        ).order_by("created_at"),
+        "user chats": ChatSession.objects(user=user_id).order_by("-updated_at", "-id"),
+        "user chats for export": ChatSession.objects(user=user_id).order_by("created_at", "id"),
+        "chat by owner": ChatSession.objects(id=chat_id, user=user_id),
+        "user by id": User.objects(id=user_id),
+        "user by email": User.objects(email="someone@example.com"),
+        "places near": Place.objects(location__near=[73.83, 15.49], location__max_distance=2000),
+    }
+
+
+def plan_stages(plan):
+    """Yield every stage name in an explain() winning plan, depth first."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the declared Mongo indexes, or with --check verify they exist "
+        "and that the hot chat queries are served by an index scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Do not create anything; fail if an index is missing or a hot query is not indexed."
+        )
+
+    def handle(self, *args, **options):
+        failures = []
+
+        for document in DOCUMENTS:
+            name = document._meta["collection"]
+
+            if not options["check"]:
+                document.ensure_indexes()
+                self.stdout.write(f"{name}: indexes ensured")
+
+            # Mongo creates the _id index with the collection itself, which
+            # for documents without other indexes happens on first write
+            missing = [
+                index for index in document.compare_indexes()["missing"]
+                if index != [("_id", 1)]
+            ]
+
+            if missing:
+                failures.append(f"{name}: missing indexes {missing}")
+            else:
+                self.stdout.write(f"{name}: all declared indexes present")
+
+        if options["check"]:
+            for label, queryset in hot_queries().items():
+                plan = queryset.explain()["queryPlanner"]["winningPlan"]
+                stages = list(plan_stages(plan))
+                bad = BAD_STAGES.intersection(stages)
+
+                if bad:
+                    failures.append(f"{label}: {' > '.join(stages)} uses {', '.join(sorted(bad))}")
+                else:
+                    self.stdout.write(f"{label}: {' > '.join(stages)}")
+
+        if failures:
+            raise CommandError("\n".join(failures))
+
+        self.stdout.write(self.style.SUCCESS("Indexes OK"))
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.export import import_lines
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Import chats from an NDJSON export (see /api/chat/export/) for an existing user."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="NDJSON file to import, or - for stdin.")
+        parser.add_argument("--email", required=True, help="Email of the user who will own the chats.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Messages per insert_many (default: IMPORT_BATCH_SIZE)."
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects(email=options["email"]).first()
+
+        if not user:
+            raise CommandError(f"No user with email {options['email']}")
+
+        if options["path"] == "-":
+            stream = sys.stdin
+        else:
+            stream = open(options["path"], encoding="utf-8")
+
+        try:
+            chats, messages = import_lines(user, stream, batch_size=options["batch_size"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {chats} chats, {messages} messages"))
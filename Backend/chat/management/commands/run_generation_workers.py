@@ -0,0 +1,38 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.jobs import worker_loop
+
+
+class Command(BaseCommand):
+    help = "Run a pool of workers that generate queued assistant replies until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=max(settings.GENERATION_WORKERS, 1),
+            help="Number of worker threads (default: GENERATION_WORKERS)."
+        )
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(target=worker_loop, args=(stop_event,), daemon=True)
+            for _ in range(options["workers"])
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        self.stdout.write(f"Running {len(threads)} generation workers")
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            stop_event.set()
+            self.stdout.write("Stopping")
@@ -0,0 +1,66 @@
+"""
+Writing chat messages.
+
+Every message write also updates the chat's activity fields
+(``message_count``, ``last_message_preview``, ``updated_at``) with one
+atomic ``$inc``/``$set``, so list_user_chats can show and sort by them
+without reading Message. Concurrent writes to one chat keep an exact
+count; the preview and updated_at are last write wins.
+"""
+from core.mongo import ainsert, collection
+from .models import ChatSession, Message
+
+PREVIEW_LENGTH = 120
+
+
+def preview(content):
+    content = " ".join((content or "").split())
+
+    if len(content) <= PREVIEW_LENGTH:
+        return content
+
+    return content[:PREVIEW_LENGTH - 1].rstrip() + "…"
+
+
+def activity_update(count, last_content, last_at):
+    """The ChatSession update recording ``count`` new messages, the newest as given."""
+    return {
+        "$inc": {"message_count": count},
+        "$set": {
+            "last_message_preview": preview(last_content),
+            "updated_at": last_at
+        }
+    }
+
+
+def record_activity(chat_id, count, last_content, last_at):
+    ChatSession._get_collection().update_one(
+        {"_id": chat_id},
+        activity_update(count, last_content, last_at)
+    )
+
+
+def save_message(chat, role, content):
+    """Save a message to ``chat`` and update the chat's activity fields."""
+    message = Message(chat=chat, role=role, content=content)
+    message.save()
+
+    record_activity(chat.id, 1, content, message.created_at)
+    return message
+
+
+def delete_message(chat, message_id):
+    """Delete one of ``chat``'s messages, e.g. a partial reply being replaced."""
+    if Message.objects(id=message_id, chat=chat).delete():
+        ChatSession.objects(id=chat.id).update_one(dec__message_count=1)
+
+
+async def asave_message(chat, role, content):
+    """save_message through the async Mongo client."""
+    message = await ainsert(Message(chat=chat, role=role, content=content))
+
+    await collection(ChatSession).update_one(
+        {"_id": chat.id},
+        activity_update(1, content, message.created_at)
+    )
+    return message
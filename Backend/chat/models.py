@@ -1,4 +1,4 @@
-from mongoengine import Document, StringField, DateTimeField, ReferenceField
+from mongoengine import Document, StringField, DateTimeField, ReferenceField, DynamicField, BooleanField, IntField, PointField, FloatField, ObjectIdField
 from datetime import datetime
 from users.models import User
 
@@ -8,10 +8,35 @@ class ChatSession(Document):
     title = StringField()
     created_at = DateTimeField(default=datetime.utcnow)
 
+    # Rolling summary of every message up to and including summary_until;
+    # only newer messages are sent to the LLM verbatim
+    summary = StringField()
+    summary_until = DateTimeField()
+
+    # Whether replies may be served from / stored in the shared response cache
+    response_cache_enabled = BooleanField(default=True)
+
+    # Denormalized from Message by chat.messages on every write, for the
+    # chat list; backfill_chat_activity fills them for older chats. No
+    # default for updated_at: one would be applied to older chats on load
+    message_count = IntField(default=0)
+    last_message_preview = StringField()
+    updated_at = DateTimeField()
+
     meta = {
-        "collection": "chat_sessions"
+        "collection": "chat_sessions",
+        "indexes": [
+            # export: user's chats by creation time (_id breaks ties)
+            ("user", "-created_at", "-id"),
+            # list_user_chats: user's chats, most recently active first
+            ("user", "-updated_at", "-id")
+        ]
     }
 
+    def clean(self):
+        if self.updated_at is None:
+            self.updated_at = self.created_at
+
 
 class Message(Document):
     chat = ReferenceField(ChatSession, required=True)
@@ -20,5 +45,154 @@ class Message(Document):
     created_at = DateTimeField(default=datetime.utcnow)
 
     meta = {
-        "collection": "messages"
+        "collection": "messages",
+        "indexes": [
+            # chat history and context building, in order
+            ("chat", "created_at", "id")
+        ]
+    }
+
+
+class CacheEntry(Document):
+    # Namespaced cache key, e.g. "images:pexels:eiffel tower tourist attraction"
+    key = StringField(primary_key=True)
+    value = DynamicField()
+    expires_at = DateTimeField(required=True)
+
+    meta = {
+        "collection": "cache_entries",
+        "indexes": [
+            # Mongo's TTL monitor removes entries once expires_at has passed
+            {"fields": ["expires_at"], "expireAfterSeconds": 0}
+        ]
+    }
+
+
+class GenerationJob(Document):
+    """An assistant reply waiting to be generated by a worker (see chat.jobs)."""
+
+    chat = ReferenceField(ChatSession, required=True)
+    user = ReferenceField(User, required=True)
+    status = StringField(required=True, default="queued", choices=["queued", "running", "done", "failed"])
+    reply = ReferenceField(Message)
+    error = StringField()
+    attempts = IntField(default=0)
+    created_at = DateTimeField(default=datetime.utcnow)
+    started_at = DateTimeField()
+    # A running job whose lease has passed is assumed lost and is picked up again
+    lease_expires_at = DateTimeField()
+    finished_at = DateTimeField()
+
+    meta = {
+        "collection": "generation_jobs",
+        "indexes": [
+            # workers claiming the oldest queued job
+            ("status", "created_at"),
+            # finished jobs are kept for a day so clients can still poll them
+            {"fields": ["finished_at"], "expireAfterSeconds": 24 * 60 * 60}
+        ]
+    }
+
+
+class CacheLock(Document):
+    """Marks a cache key as being loaded by one worker (see TwoTierCache)."""
+
+    key = StringField(primary_key=True)
+    owner = StringField(required=True)
+    expires_at = DateTimeField(required=True)
+
+    meta = {
+        "collection": "cache_locks",
+        "indexes": [
+            {"fields": ["expires_at"], "expireAfterSeconds": 0}
+        ]
+    }
+
+
+class Place(Document):
+    """A TomTom POI kept locally so nearby searches can be answered with $geoNear."""
+
+    tomtom_id = StringField(primary_key=True)
+    name = StringField()
+    category = StringField()
+    location = PointField(required=True)  # 2dsphere index, [lon, lat]
+    image = StringField()
+    fetched_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        "collection": "places",
+        "indexes": [
+            # POIs TomTom stops returning are dropped once no refresh has
+            # touched them for 30 days
+            {"fields": ["fetched_at"], "expireAfterSeconds": 30 * 24 * 60 * 60}
+        ]
+    }
+
+
+class PlaceCoverage(Document):
+    """When a geohash cell was last searched on TomTom and stored in ``places``."""
+
+    cell = StringField(primary_key=True)
+    fetched_at = DateTimeField(required=True)
+
+    meta = {
+        "collection": "place_coverage"
+    }
+
+
+class AdmissionBucket(Document):
+    """A user's send_message token bucket, when ADMISSION_BACKEND is "mongo"."""
+
+    key = StringField(primary_key=True)
+    tokens = FloatField(required=True)
+    updated_at = DateTimeField(required=True)
+
+    meta = {
+        "collection": "admission_buckets",
+        "indexes": [
+            # Idle buckets are full again long before this
+            {"fields": ["updated_at"], "expireAfterSeconds": 24 * 60 * 60}
+        ]
+    }
+
+
+class AdmissionSlot(Document):
+    """An in-flight generation, when ADMISSION_BACKEND is "mongo"."""
+
+    user_id = StringField(required=True)
+    expires_at = DateTimeField(required=True)
+
+    meta = {
+        "collection": "admission_slots",
+        "indexes": [
+            ("user_id", "expires_at"),
+            {"fields": ["expires_at"], "expireAfterSeconds": 0}
+        ]
+    }
+
+
+class IdempotencyKey(Document):
+    """A send_message Idempotency-Key and, once done, the response it got."""
+
+    key = StringField(primary_key=True)  # "<user id>:<Idempotency-Key header>"
+    fingerprint = StringField(required=True)
+    status = StringField(choices=["pending", "done"], default="pending")
+    response = DynamicField()
+    status_code = IntField()
+
+    # A pending key whose lease ran out is taken over by the next retry
+    locked_until = DateTimeField(required=True)
+    expires_at = DateTimeField(required=True)
+
+    # What a failed attempt already saved, so the retry that takes the key
+    # over reuses the chat and user message and replaces the partial reply
+    chat_id = ObjectIdField()
+    user_message_id = ObjectIdField()
+    reply_message_id = ObjectIdField()
+
+    meta = {
+        "collection": "idempotency_keys",
+        "indexes": [
+            {"fields": ["expires_at"], "expireAfterSeconds": 0}
+        ]
     }
@@ -0,0 +1,99 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from mongoengine.queryset.visitor import Q
+
+
+def encode_cursor(value, object_id):
+    raw = json.dumps([value.isoformat() if value else None, str(object_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return ``(datetime or None, ObjectId)`` from an opaque cursor, or raise ValueError."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, object_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(value) if value else None), ObjectId(object_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def parse_limit(value, default, maximum):
+    """Parse a ``limit`` query parameter, clamped to ``maximum``; raise ValueError if invalid."""
+    if value in (None, ""):
+        return default
+
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = 0
+
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+
+    return min(limit, maximum)
+
+
+def parse_offset(value):
+    """Parse an ``offset`` parameter; raise ValueError if invalid."""
+    if value in (None, ""):
+        return 0
+
+    try:
+        offset = int(value)
+    except (TypeError, ValueError):
+        offset = -1
+
+    if offset < 0:
+        raise ValueError("offset must be a non-negative integer")
+
+    return offset
+
+
+def keyset_page(queryset, field, limit, cursor=None, descending=False):
+    """
+    Return one page of ``queryset`` ordered by ``(field, _id)``, and the next cursor.
+
+    Pages continue strictly after the row the cursor was made from, so rows
+    inserted meanwhile never shift a page. ``next_cursor`` is None on the
+    last page. Rows missing ``field`` sort as null: after all others when
+    descending, before them otherwise. Works on ``as_pymongo()`` querysets
+    too, whose rows are raw dicts.
+    """
+    if cursor:
+        value, object_id = decode_cursor(cursor)
+        after = "lt" if descending else "gt"
+
+        same_value = Q(**{field: value, f"id__{after}": object_id})
+
+        if value is not None:
+            later = Q(**{f"{field}__{after}": value}) | same_value
+
+            # Null rows come last when descending, and $lt never matches them
+            if descending:
+                later |= Q(**{field: None})
+
+            queryset = queryset.filter(later)
+        elif descending:
+            queryset = queryset.filter(same_value)
+        else:
+            queryset = queryset.filter(Q(**{f"{field}__ne": None}) | same_value)
+
+    prefix = "-" if descending else ""
+    rows = list(queryset.order_by(f"{prefix}{field}", f"{prefix}id").limit(limit + 1))
+
+    next_cursor = None
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(last.get(field), last["_id"])
+        else:
+            next_cursor = encode_cursor(getattr(last, field), last.id)
+
+    return rows, next_cursor
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from pymongo import UpdateOne
+
+from .models import Place, PlaceCoverage
+
+
+def has_fresh_coverage(cell):
+    """Whether ``cell`` was searched on TomTom within PLACE_COVERAGE_TTL."""
+    since = datetime.utcnow() - timedelta(seconds=settings.PLACE_COVERAGE_TTL)
+    return PlaceCoverage.objects(cell=cell, fetched_at__gte=since).count() > 0
+
+
+def store_places(cell, places):
+    """
+    Upsert TomTom POIs by id and mark ``cell`` as covered.
+
+    Stored images are kept: a refresh only updates what TomTom returns.
+    """
+    now = datetime.utcnow()
+
+    operations = [
+        UpdateOne(
+            {"_id": place["id"]},
+            {"$set": {
+                "name": place["name"],
+                "category": place["category"],
+                "location": {"type": "Point", "coordinates": [place["longitude"], place["latitude"]]},
+                "fetched_at": now
+            }},
+            upsert=True
+        )
+        for place in places
+        if place.get("id")
+    ]
+
+    if operations:
+        Place._get_collection().bulk_write(operations, ordered=False)
+
+    PlaceCoverage.objects(cell=cell).update_one(set__fetched_at=now, upsert=True)
+
+
+def places_near(lat, lon, radius_m, limit):
+    """Stored POIs within ``radius_m`` of a point, nearest first, in the shape search_nearby_cell returns."""
+    pipeline = [
+        {"$geoNear": {
+            "near": {"type": "Point", "coordinates": [lon, lat]},
+            "distanceField": "distance_m",
+            "maxDistance": radius_m,
+            "spherical": True
+        }},
+        {"$limit": limit}
+    ]
+
+    return [
+        {
+            "id": place["_id"],
+            "name": place.get("name", "Unknown Place"),
+            "category": place.get("category", "place"),
+            "latitude": place["location"]["coordinates"][1],
+            "longitude": place["location"]["coordinates"][0],
+            "image": place.get("image")
+        }
+        for place in Place.objects.aggregate(pipeline)
+    ]
+
+
+def save_images(images):
+    """Remember image URLs found for stored POIs, given as ``{tomtom_id: url}``."""
+    operations = [
+        UpdateOne({"_id": tomtom_id}, {"$set": {"image": image}})
+        for tomtom_id, image in images.items()
+    ]
+
+    if operations:
+        Place._get_collection().bulk_write(operations, ordered=False)
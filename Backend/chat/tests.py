@@ -1,3 +1,718 @@
-from django.test import TestCase
+"""
+Tests for the chat app. Mongo is mongomock, as in the benchmarks, and
+upstream calls are stubbed:
 
-# Create your tests here.
+    pip install -r requirements-dev.txt
+    python manage.py test chat
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+import httpx
+import jwt
+import requests
+from django.conf import settings
+from django.core.management import call_command
+from django.test import Client, SimpleTestCase, override_settings
+from mongoengine import connect, disconnect
+from pymongo import UpdateOne
+
+from benchmarks.common import StubServer
+from benchmarks.stubs import make_hf_handler, REPLY_WORDS
+from users.models import User
+from . import admission, idempotency, views
+from .cache import caches, TwoTierCache
+from . import context
+from .context import fold_if_due, fold_messages, schedule_fold
+from .gemini_service import response_cache
+from .messages import save_message
+from .models import CacheEntry, CacheLock, ChatSession, Message, IdempotencyKey
+from .upstream import upstream, CircuitBreaker, Upstream, UpstreamUnavailable
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+# The tests sign JWTs, so give them a key if the environment has none (as
+# benchmarks.common does). Not override_settings: Django cannot restore an
+# empty SECRET_KEY afterwards
+if not os.getenv("SECRET_KEY"):
+    settings.SECRET_KEY = "chat-tests-secret-key-not-for-production"
+
+
+def sse_events(body):
+    """``(event, data)`` pairs from a Server-Sent Events body."""
+    events = []
+
+    for block in body.decode().strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+
+    return events
+
+
+def fake_stream(*tokens, error=None):
+    """A stream_ai_response stub yielding ``tokens``, then raising ``error`` if given."""
+    def stream(conversation_messages, use_cache=True):
+        yield from tokens
+
+        if error:
+            raise error
+
+    return stream
+
+
+def run_threads(count, fn):
+    """Call ``fn`` on ``count`` threads at once; return each one's result or exception."""
+    results = [None] * count
+    start = threading.Barrier(count)
+
+    def run(i):
+        start.wait()
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    return results
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting")
+        time.sleep(0.005)
+
+
+class MongomockUpdateOne(UpdateOne):
+    """UpdateOne without the ``sort`` option, which mongomock's bulk_write does not take."""
+
+    def _add_to_bulk(self, bulkobj):
+        bulkobj.add_update(self._filter, self._doc, False, bool(self._upsert))
+
+
+@skipUnless(mongomock, "needs mongomock (pip install -r requirements-dev.txt)")
+class MongoTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        disconnect()
+        connect(db="travel_ai_test", host="mongodb://localhost", mongo_client_class=mongomock.MongoClient)
+
+    @classmethod
+    def tearDownClass(cls):
+        disconnect()
+        super().tearDownClass()
+
+    def setUp(self):
+        for document in (User, ChatSession, Message, IdempotencyKey):
+            document.drop_collection()
+
+        admission._admission = None
+
+        # Fold summaries inline, so no thread outlives the test
+        patcher = mock.patch("chat.views.schedule_fold", fold_if_due)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User(email=f"test-{time.time_ns()}@example.com", name="Test").save()
+        token = jwt.encode(
+            {"user_id": str(self.user.id), "email": self.user.email, "exp": int(time.time()) + 3600},
+            settings.SECRET_KEY,
+            algorithm="HS256"
+        )
+        self.client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def send(self, message="Plan a trip to Goa", key=None, **data):
+        return self.client.post(
+            "/api/chat/message/",
+            {"message": message, **data},
+            content_type="application/json",
+            headers={"Idempotency-Key": key} if key else {}
+        )
+
+    def inflight(self):
+        return admission.get_admission().inflight.get(str(self.user.id), 0)
+
+    def count_finish(self):
+        """Patch stream_reply to record every ``finish`` call; returns the list of calls."""
+        calls = []
+
+        def stream_reply(chat, conversation_history, finish, *args):
+            def counted(*finish_args):
+                calls.append(finish_args)
+                return finish(*finish_args)
+
+            return real_stream_reply(chat, conversation_history, counted, *args)
+
+        real_stream_reply = views.stream_reply
+        patcher = mock.patch("chat.views.stream_reply", stream_reply)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return calls
+
+    def replies(self):
+        return [m.content for m in Message.objects(role="assistant").order_by("created_at")]
+
+
+@override_settings(ADMISSION_ENABLED=True, ADMISSION_BACKEND="memory", ADMISSION_USER_INFLIGHT=1)
+class StreamAdmissionTests(MongoTestCase):
+    def test_stream_sends_tokens_and_saves_the_reply(self):
+        finished = self.count_finish()
+
+        with mock.patch("chat.views.stream_ai_response", fake_stream("Day 1: ", "beaches")):
+            response = self.send(stream=True)
+            events = sse_events(b"".join(response.streaming_content))
+
+        chat_id = str(ChatSession.objects.get().id)
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(events, [
+            ("start", {"chat_id": chat_id}),
+            ("token", {"token": "Day 1: "}),
+            ("token", {"token": "beaches"}),
+            ("done", {"chat_id": chat_id})
+        ])
+        self.assertEqual(self.replies(), ["Day 1: beaches"])
+        self.assertEqual(finished, [({"chat_id": chat_id, "reply": "Day 1: beaches"}, 200)])
+        self.assertEqual(self.inflight(), 0)
+
+    def test_client_closing_early_saves_the_partial_reply(self):
+        finished = self.count_finish()
+
+        with mock.patch("chat.views.stream_ai_response", fake_stream("Day 1: ", "beaches")):
+            response = self.send(stream=True)
+            content = iter(response.streaming_content)
+            next(content)
+            next(content)
+
+            # The slot is held while the reply streams
+            self.assertEqual(self.inflight(), 1)
+            self.assertEqual(self.send(stream=True).status_code, 429)
+
+            response.close()
+
+        self.assertEqual(self.replies(), ["Day 1: "])
+        self.assertEqual(finished, [()])
+        self.assertEqual(self.inflight(), 0)
+
+    def test_upstream_error_is_sent_as_an_event(self):
+        finished = self.count_finish()
+
+        with mock.patch("chat.views.stream_ai_response", fake_stream("Day 1: ", error=RuntimeError("upstream"))):
+            events = sse_events(b"".join(self.send(stream=True).streaming_content))
+
+        self.assertEqual(events[-1], ("error", {"error": "upstream"}))
+        self.assertEqual(self.replies(), ["Day 1: "])
+        self.assertEqual(finished, [()])
+        self.assertEqual(self.inflight(), 0)
+
+    def test_slot_released_when_saving_the_reply_fails(self):
+        def save_user_message_only(chat, role, content):
+            if role == "assistant":
+                raise RuntimeError("db down")
+            return save_message(chat, role, content)
+
+        with mock.patch("chat.views.stream_ai_response", fake_stream("Day 1")), \
+                mock.patch("chat.views.save_message", save_user_message_only):
+            response = self.send(stream=True)
+
+            with self.assertRaises(RuntimeError):
+                b"".join(response.streaming_content)
+
+        self.assertEqual(self.inflight(), 0)
+
+        with mock.patch("chat.views.stream_ai_response", fake_stream("Day 2")):
+            response = self.send(stream=True)
+            b"".join(response.streaming_content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.inflight(), 0)
+
+
+class HFStreamTests(MongoTestCase):
+    """Streamed replies through the real HF client, against benchmarks.stubs' HF stand-in."""
+
+    def setUp(self):
+        super().setUp()
+        CacheEntry.drop_collection()
+        response_cache.local.clear()
+        upstream("hf").breaker.record_success()
+
+    def serve(self, **options):
+        server = StubServer(make_hf_handler(reply_words=5, **options)).__enter__()
+        self.addCleanup(server.__exit__, None, None, None)
+
+        hf_url = self.settings(HF_API_URL=f"{server.url}/v1/chat/completions")
+        hf_url.enable()
+        self.addCleanup(hf_url.disable)
+        return server
+
+    def stream(self, message="Plan a trip to Goa"):
+        return sse_events(b"".join(self.send(message, stream=True).streaming_content))
+
+    def test_streams_and_caches_a_complete_reply(self):
+        server = self.serve()
+        reply = "".join(word + " " for word in REPLY_WORDS[:5])
+
+        with mock.patch("chat.gemini_service.observe_llm") as observe_llm:
+            events = self.stream()
+
+        self.assertEqual([data["token"] for event, data in events if event == "token"], [
+            word + " " for word in REPLY_WORDS[:5]
+        ])
+        self.assertEqual(events[-1][0], "done")
+        self.assertEqual(self.replies(), [reply])
+        observe_llm.assert_called_once_with("stream", mock.ANY, 400, 5)
+
+        # The same first message in a new chat is answered from the cache
+        events = self.stream()
+        self.assertEqual(events[1], ("token", {"token": reply}))
+        self.assertEqual(server.requests, 1)
+
+    def test_cut_off_stream_is_an_error_and_not_cached(self):
+        server = self.serve(cut_off_after=2)
+
+        events = self.stream()
+
+        self.assertEqual(events[-1][0], "error")
+        self.assertEqual(len([event for event, data in events if event == "token"]), 2)
+        self.assertEqual(self.replies(), ["Day 1: "])
+
+        self.stream()
+        self.assertEqual(server.requests, 2)
+
+    def test_reply_cut_at_max_tokens_is_not_cached(self):
+        server = self.serve(finish_reason="length")
+
+        self.assertEqual(self.stream()[-1][0], "done")
+        self.stream()
+        self.assertEqual(server.requests, 2)
+
+    def test_client_closing_early_closes_the_upstream_response(self):
+        self.serve(token_delay=0.01)
+        close = requests.Response.close
+
+        with mock.patch.object(requests.Response, "close", autospec=True, side_effect=close) as closed:
+            response = self.send(stream=True)
+            content = iter(response.streaming_content)
+            next(content)
+            next(content)
+            response.close()
+
+        closed.assert_called()
+        self.assertEqual(self.replies(), ["Day "])
+        self.assertEqual(self.inflight(), 0)
+
+
+class IdempotencyTests(MongoTestCase):
+    def test_retry_of_a_pending_request_is_rejected_without_waiting(self):
+        with mock.patch("chat.views.stream_ai_response", fake_stream("Day 1")):
+            first = self.send(stream=True, key="trip-1")
+            next(iter(first.streaming_content))
+
+            started = time.monotonic()
+            retry = self.send(stream=True, key="trip-1")
+
+        self.assertEqual(retry.status_code, 409)
+        self.assertEqual(retry["Retry-After"], "1")
+        self.assertLess(time.monotonic() - started, 1)
+        first.close()
+
+    def test_failed_stream_is_generated_again_on_retry(self):
+        with mock.patch("chat.views.stream_ai_response", fake_stream("Day", error=RuntimeError("upstream"))):
+            response = self.send(stream=True, key="trip-1")
+            self.assertIn(b"event: error", b"".join(response.streaming_content))
+
+        record = IdempotencyKey.objects.get()
+        self.assertEqual(record.status, "pending")
+        self.assertLessEqual(record.locked_until, datetime.utcnow())
+
+        with mock.patch("chat.views.stream_ai_response", fake_stream("Day 1")):
+            response = self.send(stream=True, key="trip-1")
+            body = b"".join(response.streaming_content)
+
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertIn(b"Day 1", body)
+        self.assertEqual(IdempotencyKey.objects.get().status, "done")
+
+    def test_retry_after_a_dropped_stream_reuses_the_chat_and_message(self):
+        with mock.patch("chat.views.stream_ai_response", fake_stream("Day 1: ", "beaches")):
+            response = self.send("Plan Goa", stream=True, key="trip-1")
+            content = iter(response.streaming_content)
+            next(content)
+            next(content)
+            response.close()
+
+            response = self.send("Plan Goa", stream=True, key="trip-1")
+            b"".join(response.streaming_content)
+
+        chat = ChatSession.objects.get()
+        messages = Message.objects(chat=chat).order_by("created_at")
+
+        self.assertEqual(
+            [(m.role, m.content) for m in messages],
+            [("user", "Plan Goa"), ("assistant", "Day 1: beaches")]
+        )
+        self.assertEqual(chat.message_count, 2)
+
+        # And a third try is answered from the stored reply
+        response = self.send("Plan Goa", stream=True, key="trip-1")
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        self.assertEqual(Message.objects.count(), 2)
+
+    def test_lease_is_renewed_once_half_used(self):
+        record, leader = idempotency.claim(self.user, "trip-1", "fingerprint")
+        self.assertTrue(leader)
+        self.assertFalse(idempotency.renewal_due(record))
+
+        record.locked_until -= timedelta(seconds=settings.IDEMPOTENCY_LEASE * 0.6)
+        self.assertTrue(idempotency.renewal_due(record))
+
+        idempotency.renew(record)
+        self.assertFalse(idempotency.renewal_due(record))
+        self.assertGreater(
+            IdempotencyKey.objects.get().locked_until,
+            datetime.utcnow() + timedelta(seconds=settings.IDEMPOTENCY_LEASE * 0.9)
+        )
+
+
+class ChatListTests(MongoTestCase):
+    def add_chats(self):
+        """Three chats with activity fields, and three older ones without (never backfilled)."""
+        start = datetime(2025, 1, 1)
+
+        for day in range(3):
+            chat = ChatSession(user=self.user, title=f"new {day}", created_at=start + timedelta(days=day)).save()
+            save_message(chat, "user", f"hello {day}")
+
+        ChatSession._get_collection().insert_many([
+            {"user": self.user.id, "title": f"old {day}", "created_at": start - timedelta(days=day)}
+            for day in range(3)
+        ])
+
+    def list_chats(self, **params):
+        return self.client.get("/api/chat/list/", params).json()
+
+    def test_pages_include_chats_without_updated_at(self):
+        self.add_chats()
+        expected = [chat["chat_id"] for chat in self.list_chats()]
+
+        for raw_reads in (False, True):
+            with self.subTest(raw_reads=raw_reads), self.settings(CHAT_RAW_READS=raw_reads):
+                seen, cursor = [], None
+
+                while True:
+                    page = self.list_chats(limit=2, **({"cursor": cursor} if cursor else {}))
+                    seen += [chat["chat_id"] for chat in page["chats"]]
+                    cursor = page["next_cursor"]
+
+                    if not cursor:
+                        break
+
+                self.assertEqual(len(expected), 6)
+                self.assertEqual(seen, expected)
+
+    def test_backfill_missing_only_recounts_chats_written_since(self):
+        self.add_chats()
+        old = ChatSession.objects(title="old 0").get()
+
+        for content in ("first", "second"):
+            Message(chat=old, role="user", content=content).save()
+
+        save_message(old, "assistant", "third")
+        self.assertEqual(ChatSession.objects.get(id=old.id).message_count, 1)
+
+        with mock.patch("chat.management.commands.backfill_chat_activity.UpdateOne", MongomockUpdateOne):
+            call_command("backfill_chat_activity", missing_only=True, stdout=StringIO())
+
+        old.reload()
+        self.assertEqual(old.message_count, 3)
+        self.assertEqual(old.last_message_preview, "third")
+        self.assertEqual(ChatSession.objects(message_count=1).count(), 3)
+        self.assertFalse(ChatSession.objects(updated_at=None))
+
+
+@override_settings(CONTEXT_KEEP_TURNS=1, CONTEXT_SUMMARY_BATCH=2)
+class ContextTests(MongoTestCase):
+    def test_summary_is_folded_after_the_reply(self):
+        chat = ChatSession(user=self.user, title="Goa").save()
+
+        for day in range(3):
+            save_message(chat, "user", f"Day {day}?")
+            save_message(chat, "assistant", f"Beaches on day {day}.")
+
+        calls = []
+
+        def generate(conversation_messages, use_cache=True):
+            calls.append(("reply", conversation_messages))
+            return "Day 4: Old Goa."
+
+        def summarize(previous_summary, conversation_messages, max_words=200):
+            calls.append(("summary", conversation_messages))
+            return "Beaches on days 0 to 2."
+
+        with mock.patch("chat.views.generate_ai_response", generate), \
+                mock.patch("chat.context.summarize_conversation", summarize):
+            response = self.send("And day 4?", chat_id=str(chat.id))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([call for call, _ in calls], ["reply", "summary"])
+
+        # The reply saw every message verbatim; the fold kept the last turn
+        self.assertEqual(len(calls[0][1]), 7)
+        self.assertEqual(len(calls[1][1]), 6)
+
+        chat.reload()
+        self.assertEqual(chat.summary, "Beaches on days 0 to 2.")
+
+    @override_settings(CONTEXT_KEEP_TURNS=0)
+    def test_keeping_no_turns_folds_every_message(self):
+        chat = ChatSession(user=self.user, title="Goa").save()
+        messages = [save_message(chat, "user", f"Day {day}?") for day in range(2)]
+
+        with mock.patch("chat.context.summarize_conversation", return_value="Days 0 and 1.") as summarize:
+            self.assertEqual(fold_messages(chat, messages), [])
+
+        self.assertEqual(len(summarize.call_args.args[1]), 2)
+        self.assertEqual(chat.summary_until, messages[-1].created_at)
+
+    def test_scheduled_folds_share_a_bounded_pool(self):
+        chat = ChatSession(user=self.user, title="Goa").save()
+
+        self.addCleanup(context._folding.discard, chat.id)
+
+        with mock.patch("chat.context.fold_pool") as pool:
+            schedule_fold(chat)
+            # The next reply finds the chat already queued
+            schedule_fold(chat)
+            self.assertEqual(pool.submit.call_count, 1)
+
+            # Once the fold has run, the chat can be queued again
+            fold, *args = pool.submit.call_args.args
+            fold(*args)
+            schedule_fold(chat)
+            self.assertEqual(pool.submit.call_count, 2)
+
+        self.assertEqual(context.fold_pool._max_workers, settings.CONTEXT_FOLD_WORKERS)
+
+    @override_settings(CONTEXT_TOKEN_BUDGET=600)
+    def test_trimmed_history_is_not_shared_through_the_cache(self):
+        chat = ChatSession(user=self.user, title="Goa").save()
+        save_message(chat, "user", "Plan a trip to Goa")
+        save_message(chat, "assistant", "Day 1: " + "beaches " * 300)
+
+        seen = []
+
+        def generate(conversation_messages, use_cache=True):
+            seen.append(use_cache)
+            return "Day 1: backwaters."
+
+        with mock.patch("chat.views.generate_ai_response", generate), \
+                mock.patch("chat.context.summarize_conversation", return_value="Goa."):
+            self.send("And Kerala?", chat_id=str(chat.id))
+
+        with override_settings(CONTEXT_TOKEN_BUDGET=6000), \
+                mock.patch("chat.views.generate_ai_response", generate):
+            self.send("Plan a trip to Goa")
+
+        self.assertEqual(seen, [False, True])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def open_breaker(self, breaker):
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+    def wait_out(self, breaker):
+        breaker.opened_at -= breaker.reset_timeout
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after(), 29)
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        self.open_breaker(breaker)
+        self.wait_out(breaker)
+
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_opens_again(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+        self.open_breaker(breaker)
+        self.wait_out(breaker)
+
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+    def test_cancelled_trial_lets_the_next_call_try(self):
+        calls = []
+
+        async def hang_once(request):
+            calls.append(request)
+
+            if len(calls) == 1:
+                await asyncio.sleep(60)
+
+            return httpx.Response(200, json={})
+
+        client = Upstream("test", retries=0, failure_threshold=1, reset_timeout=30)
+        self.open_breaker(client.breaker)
+        self.wait_out(client.breaker)
+
+        async def scenario():
+            client._async_clients[asyncio.get_running_loop()] = httpx.AsyncClient(
+                transport=httpx.MockTransport(hang_once)
+            )
+
+            trial = asyncio.ensure_future(client.aget("http://upstream.test/"))
+            await asyncio.sleep(0.01)
+
+            # The trial is in flight: everyone else is refused
+            with self.assertRaises(UpstreamUnavailable):
+                await client.aget("http://upstream.test/")
+
+            trial.cancel()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+
+            self.assertEqual(client.breaker.state, "half_open")
+            self.assertFalse(client.breaker.trial_in_flight)
+
+            response = await client.aget("http://upstream.test/")
+            self.assertEqual(response.status_code, 200)
+
+        asyncio.run(scenario())
+        self.assertEqual(client.breaker.state, "closed")
+        self.assertEqual(len(calls), 2)
+
+
+class TwoTierCacheTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        CacheEntry.drop_collection()
+        CacheLock.drop_collection()
+
+        namespace = f"test-{uuid.uuid4().hex}"
+        self.cache = TwoTierCache(namespace, ttl=60)
+        self.addCleanup(caches.pop, namespace)
+
+    def test_concurrent_misses_share_one_load(self):
+        calls = []
+
+        def loader():
+            calls.append(threading.current_thread())
+            # Answer only once every other caller is waiting on this load
+            wait_for(lambda: self.cache.flight.collapsed == 7)
+            return "Day 1: beaches"
+
+        results = run_threads(8, lambda: self.cache.get_or_set("goa", loader))
+
+        self.assertEqual(results, ["Day 1: beaches"] * 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.stats()["collapsed"], 7)
+        self.assertEqual(self.cache.get("goa"), "Day 1: beaches")
+
+    def test_leader_error_reaches_every_waiter(self):
+        calls = []
+
+        def loader():
+            calls.append(threading.current_thread())
+            wait_for(lambda: self.cache.flight.collapsed == 3)
+            raise RuntimeError("upstream down")
+
+        results = run_threads(4, lambda: self.cache.get_or_set("goa", loader))
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(len({id(result) for result in results}), 1)
+
+        # Nothing was cached, so the next call loads again
+        self.assertEqual(self.cache.get_or_set("goa", lambda: "Day 1: beaches"), "Day 1: beaches")
+
+    @override_settings(CACHE_CROSS_WORKER_LOCKS=True, CACHE_LOCK_POLL_INTERVAL=0.01)
+    def test_waits_for_the_worker_holding_the_lock(self):
+        key = self.cache._key("goa")
+        CacheLock(key=key, owner="other-worker", expires_at=datetime.utcnow() + timedelta(seconds=10)).save()
+
+        loader = mock.Mock(return_value="ours")
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(self.cache.get_or_set("goa", loader)))
+        waiter.start()
+        wait_for(lambda: self.cache.misses == 1)
+
+        # The other worker finishes its load
+        CacheEntry(key=key, value="theirs", expires_at=datetime.utcnow() + timedelta(seconds=60)).save()
+        waiter.join(5)
+
+        self.assertEqual(result, ["theirs"])
+        loader.assert_not_called()
+        self.assertEqual(self.cache.collapsed_across_workers, 1)
+
+    @override_settings(CACHE_CROSS_WORKER_LOCKS=True, CACHE_LOCK_POLL_INTERVAL=0.01)
+    def test_loads_itself_when_the_lock_holder_failed(self):
+        key = self.cache._key("goa")
+        CacheLock(key=key, owner="other-worker", expires_at=datetime.utcnow() + timedelta(seconds=10)).save()
+
+        loader = mock.Mock(return_value="ours")
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(self.cache.get_or_set("goa", loader)))
+        waiter.start()
+        wait_for(lambda: self.cache.misses == 1)
+
+        # The other worker's load failed: it releases the lock without a value
+        CacheLock.objects(key=key).delete()
+        waiter.join(5)
+
+        self.assertEqual(result, ["ours"])
+        loader.assert_called_once()
+        self.assertEqual(CacheEntry.objects.get(key=key).value, "ours")
+
+    @override_settings(CACHE_CROSS_WORKER_LOCKS=True)
+    def test_takes_over_a_lock_whose_holder_died(self):
+        key = self.cache._key("goa")
+        CacheLock(key=key, owner="dead-worker", expires_at=datetime.utcnow() - timedelta(seconds=1)).save()
+
+        started = time.monotonic()
+        self.assertEqual(self.cache.get_or_set("goa", lambda: "ours"), "ours")
+
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertFalse(CacheLock.objects(key=key))
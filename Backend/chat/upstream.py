@@ -0,0 +1,294 @@
+"""
+Pooled, guarded HTTP clients for the upstream APIs (HF, TomTom, Pexels, ...).
+
+Each upstream gets one ``requests.Session`` per process, so connections are
+kept alive and reused, plus its own timeouts, bounded retries with jittered
+backoff and a circuit breaker. While an upstream's breaker is open, calls
+fail at once with UpstreamUnavailable and callers serve their fallback.
+
+Async views use the same clients through ``aget``/``apost``, which go
+through an ``httpx.AsyncClient`` but share the breaker, timeouts and retry
+policy with the sync methods.
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from core.metrics import Counter, observe_http_response, observe_upstream, UPSTREAM_SECONDS
+
+# Statuses worth retrying for idempotent requests
+RETRY_STATUSES = {429, 502, 503, 504}
+
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total", "Retried upstream calls.", labelnames=("upstream",)
+)
+UPSTREAM_REJECTED = Counter(
+    "upstream_rejected_total", "Calls failed fast because the circuit was open.", labelnames=("upstream",)
+)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures.
+
+    While open, calls are refused for ``reset_timeout`` seconds; then a
+    single trial call is let through (half-open). Its success closes the
+    breaker, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """Seconds until the next trial call will be let through."""
+        if self.opened_at is None:
+            return 0
+        return max(0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+
+            if state == "closed":
+                return True
+
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Let another trial through after one ended without an outcome (cancelled)."""
+        with self._lock:
+            self.trial_in_flight = False
+
+
+class Upstream:
+    def __init__(self, name, connect_timeout=3.05, read_timeout=10, retries=2,
+                 backoff=0.2, pool_size=20, async_pool_size=200,
+                 failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        # httpx clients are bound to the event loop that created them
+        self.pool_size = pool_size
+        self.async_pool_size = async_pool_size
+        self._async_clients = weakref.WeakKeyDictionary()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.hooks["response"].append(observe_http_response)
+
+    def check_breaker(self):
+        if not self.breaker.allow():
+            UPSTREAM_REJECTED.inc(upstream=self.name)
+            raise UpstreamUnavailable(
+                f"{self.name} is temporarily unavailable",
+                retry_after=self.breaker.retry_after()
+            )
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request, retrying transient failures; return the last response.
+
+        Connection failures are retried for any method, since the request
+        never reached the upstream. Read timeouts and 429/502/503/504 answers
+        are retried only for GET. 5xx responses, 429s and network errors
+        count against the breaker; other responses close it.
+        """
+        self.check_breaker()
+
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method.upper() == "GET"
+        host = urlparse(url).hostname or ""
+
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            started = time.perf_counter()
+
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, host=host, status="error")
+
+                # ConnectTimeout is a ConnectionError too; ReadTimeout is not
+                connect_failed = isinstance(e, requests.ConnectionError)
+
+                if last_attempt or not (connect_failed or idempotent):
+                    self.breaker.record_failure()
+                    raise
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            else:
+                failed = response.status_code >= 500 or response.status_code == 429
+
+                if not failed:
+                    self.breaker.record_success()
+                    return response
+
+                if last_attempt or not idempotent or response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_failure()
+                    return response
+
+                response.close()
+
+            UPSTREAM_RETRIES.inc(upstream=self.name)
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+
+        if client is None:
+            connect_timeout, read_timeout = self.timeout
+            client = self._async_clients[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.async_pool_size,
+                    max_keepalive_connections=self.pool_size
+                )
+            )
+
+        return client
+
+    async def arequest(self, method, url, stream=False, **kwargs):
+        """
+        Async counterpart of request(), returning an ``httpx.Response``.
+
+        With ``stream=True`` the body is not read; the caller iterates it and
+        must ``await response.aclose()``.
+        """
+        self.check_breaker()
+
+        # requests leaves out headers and params that are None; do the same
+        # so call sites can pass identical arguments to both clients
+        for name in ("headers", "params"):
+            if kwargs.get(name):
+                kwargs[name] = {k: v for k, v in kwargs[name].items() if v is not None}
+
+        client = self.async_client()
+        idempotent = method.upper() == "GET"
+        host = urlparse(url).hostname or ""
+
+        try:
+            for attempt in range(self.retries + 1):
+                last_attempt = attempt == self.retries
+                started = time.perf_counter()
+
+                try:
+                    response = await client.send(client.build_request(method, url, **kwargs), stream=stream)
+                except httpx.TransportError as e:
+                    UPSTREAM_SECONDS.observe(time.perf_counter() - started, host=host, status="error")
+
+                    connect_failed = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+
+                    if last_attempt or not (connect_failed or idempotent):
+                        self.breaker.record_failure()
+                        raise
+                except Exception:
+                    self.breaker.record_failure()
+                    raise
+                else:
+                    observe_upstream(host, response.status_code, time.perf_counter() - started)
+                    failed = response.status_code >= 500 or response.status_code == 429
+
+                    if not failed:
+                        self.breaker.record_success()
+                        return response
+
+                    if last_attempt or not idempotent or response.status_code not in RETRY_STATUSES:
+                        self.breaker.record_failure()
+                        return response
+
+                    await response.aclose()
+
+                UPSTREAM_RETRIES.inc(upstream=self.name)
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        except asyncio.CancelledError:
+            # Cancelled mid-call, e.g. because the ASGI client went away. That
+            # is no verdict on the upstream, but a half-open trial must not
+            # stay claimed, or the breaker would never close again
+            self.breaker.release_trial()
+            raise
+
+    async def aget(self, url, **kwargs):
+        return await self.arequest("GET", url, **kwargs)
+
+    async def apost(self, url, **kwargs):
+        return await self.arequest("POST", url, **kwargs)
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def upstream(name):
+    """The shared client for ``name``, configured from settings.UPSTREAMS."""
+    client = _upstreams.get(name)
+
+    if client is None:
+        with _upstreams_lock:
+            client = _upstreams.get(name)
+
+            if client is None:
+                config = {**settings.UPSTREAM_DEFAULTS, **settings.UPSTREAMS.get(name, {})}
+                client = _upstreams[name] = Upstream(name, **config)
+
+    return client
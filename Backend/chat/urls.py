@@ -1,13 +1,22 @@
+from django.conf import settings
 from django.urls import path
 from .views import send_message, list_user_chats, get_chat_history, delete_chat
 from .views import nearby_places, geocode_location, reverse_geocode
+from .views import get_cache_stats, get_generation_job, export_chats
+
+if settings.ASYNC_VIEWS:
+    from .async_views import send_message, nearby_places, geocode_location, reverse_geocode
 
 urlpatterns = [
     path("message/", send_message),
+    path("jobs/<str:job_id>/", get_generation_job),
     path("list/", list_user_chats),
     path("history/<str:chat_id>/", get_chat_history),
     path("delete/<str:chat_id>/", delete_chat),
+    path("export/", export_chats),
+    path("export/<str:chat_id>/", export_chats),
     path("nearby/", nearby_places),
     path("geocode/", geocode_location),
     path("reverse-geocode/", reverse_geocode),
+    path("cache/stats/", get_cache_stats),
 ]
\ No newline at end of file
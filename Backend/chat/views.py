@@ -1,13 +1,189 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from users.auth_utils import get_user_from_request
-from .models import ChatSession, Message
+from .models import ChatSession, Message, GenerationJob
+from .jobs import enqueue_generation
+from . import places as place_store
+from .export import export_lines
+from .messages import save_message, delete_message
+from .admission import admit, AdmissionRejected
+from . import idempotency
+from .cache import TwoTierCache, normalize_query, cache_stats
+from .context import build_conversation, schedule_fold
+from .pagination import keyset_page, parse_limit, parse_offset
+from .upstream import upstream, UpstreamUnavailable
+from .geo import geohash_encode, geohash_center, cell_half_diagonal_m, precision_for_radius, haversine_km
 from datetime import datetime
 from bson import ObjectId
-from chat.gemini_service import generate_ai_response
-import requests
+from bson.errors import InvalidId
+from chat.gemini_service import generate_ai_response, stream_ai_response
+from django.http import StreamingHttpResponse
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, wait
 from django.conf import settings
+import contextvars
+import json
 import math
+import numpy as np
+
+
+def unavailable_response(error):
+    """503 for an upstream whose circuit is open, telling the client when to retry."""
+    return Response(
+        {"error": str(error)},
+        status=503,
+        headers={"Retry-After": str(math.ceil(error.retry_after) or 1)}
+    )
+
+
+def rejected_response(error):
+    """429 for a request over its admission limits, telling the client when to retry."""
+    return Response(
+        {"error": str(error)},
+        status=429,
+        headers={"Retry-After": str(math.ceil(error.retry_after) or 1)}
+    )
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_reply(chat, conversation_history, finish, record=None, use_cache=True):
+    """
+    Forward assistant tokens to the client as Server-Sent Events.
+
+    The assistant message is saved once the stream ends, including when the
+    client disconnects early (the server closes the generator, which runs the
+    ``finally`` block with whatever was produced so far). ``finish`` is then
+    called exactly once: with the reply data if the stream completed and
+    the reply was saved, otherwise with nothing. A partial reply is noted on
+    the Idempotency-Key ``record``, for the retry to replace, and the
+    record's lease is renewed while the stream runs.
+    """
+    def event_stream():
+        chunks = []
+        completed = False
+
+        try:
+            yield sse_event("start", {"chat_id": str(chat.id)})
+
+            with closing(stream_ai_response(conversation_history, use_cache=use_cache)) as tokens:
+                for token in tokens:
+                    chunks.append(token)
+                    yield sse_event("token", {"token": token})
+
+                    if record and idempotency.renewal_due(record):
+                        idempotency.renew(record)
+
+            completed = True
+            yield sse_event("done", {"chat_id": str(chat.id)})
+
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+
+        finally:
+            reply = "".join(chunks)
+            saved = False
+
+            # finish() releases the admission slot, so it must run even if
+            # saving the reply fails
+            try:
+                if reply:
+                    message = save_message(chat, "assistant", reply)
+                    saved = True
+                    schedule_fold(chat)
+
+                    if record and not completed:
+                        idempotency.save_progress(record, reply_message_id=message.id)
+            finally:
+                # A partial reply is kept in the chat, but a retry with the
+                # same Idempotency-Key replaces it
+                if saved and completed:
+                    finish({"chat_id": str(chat.id), "reply": reply}, 200)
+                else:
+                    finish()
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def replay_response(record, stream=False):
+    """Answer a retried send_message from the stored response of the original request."""
+    if record is None:
+        return Response(
+            {"error": "A request with this Idempotency-Key is still in progress"},
+            status=409,
+            headers={"Retry-After": "1"}
+        )
+
+    data = record.response
+
+    if stream and "reply" in data:
+        events = [
+            sse_event("start", {"chat_id": data["chat_id"]}),
+            sse_event("token", {"token": data["reply"]}),
+            sse_event("done", {"chat_id": data["chat_id"]}),
+        ]
+        response = StreamingHttpResponse(events, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+    else:
+        response = Response(data, status=record.status_code)
+
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+def start_message(request, user, data):
+    """
+    Idempotency-Key and admission checks for a send_message request.
+
+    Returns ``(response, None, None)`` if the request is answered already
+    (a replay, a conflict or a rejection), otherwise ``(None, finish,
+    record)``. ``finish(data, status_code)`` must be called once the reply
+    is done, or ``finish()`` if it failed. ``record`` is the claimed
+    IdempotencyKey, or None if the request had no key.
+    """
+    # 🔹 A retry carrying the same Idempotency-Key gets the original reply
+    # (or 409 while it is still generating) instead of a second generation
+    key = request.headers.get("Idempotency-Key")
+    record = None
+
+    if key:
+        if len(key) > idempotency.MAX_KEY_LENGTH:
+            return Response({"error": "Idempotency-Key is too long"}, status=400), None, None
+
+        try:
+            record, leader = idempotency.claim(user, key, idempotency.fingerprint(data))
+        except idempotency.IdempotencyMismatch as e:
+            return Response({"error": str(e)}, status=422), None, None
+
+        if not leader:
+            # Never block on a request still in progress: waiting would hold
+            # a worker and bypass admission, so the client retries later
+            done = record if record.status == "done" else None
+            return replay_response(done, stream=data.get("stream")), None, None
+
+    # 🔹 Rate and concurrency limits; queued replies are bounded by the
+    # worker pool, so they only take a rate token
+    try:
+        ticket = admit(str(user.id), hold_slot=not data.get("async"))
+    except AdmissionRejected as e:
+        if record:
+            idempotency.abandon(record)
+        return rejected_response(e), None, None
+
+    def finish(data=None, status_code=None):
+        ticket.release()
+
+        if record:
+            if data is not None and status_code < 300:
+                idempotency.complete(record, data, status_code)
+            else:
+                idempotency.abandon(record)
+
+    return None, finish, record
 
 @api_view(["POST"])
 def send_message(request):
@@ -16,11 +192,40 @@ def send_message(request):
     if not user:
         return Response({"error": "Unauthorized"}, status=401)
 
+    if not request.data.get("message"):
+        return Response({"error": "Message is required"}, status=400)
+
+    response, finish, record = start_message(request, user, request.data)
+
+    if finish is None:
+        return response
+
+    response = None
+
+    try:
+        response = reply_to_message(request, user, finish, record)
+        return response
+    finally:
+        # A streamed reply finishes when the stream ends
+        if response is None:
+            finish()
+        elif not isinstance(response, StreamingHttpResponse):
+            finish(response.data, response.status_code)
+
+
+def reply_to_message(request, user, finish, record=None):
+    """
+    Save the user's message and generate (or queue, or stream) the reply.
+
+    A retry taking over ``record`` from a failed attempt reuses the chat and
+    user message that attempt saved, and drops its partial reply.
+    """
     message_text = request.data.get("message")
     chat_id = request.data.get("chat_id")
+    use_cache = request.data.get("cache")
 
-    if not message_text:
-        return Response({"error": "Message is required"}, status=400)
+    if record and record.chat_id:
+        chat_id = record.chat_id
 
     # 🔹 Get or create chat
     if chat_id:
@@ -34,105 +239,281 @@ def send_message(request):
         )
         chat.save()
 
+    if record and not record.chat_id:
+        idempotency.save_progress(record, chat_id=chat.id)
+
+    if record and record.reply_message_id:
+        delete_message(chat, record.reply_message_id)
+        idempotency.save_progress(record, reply_message_id=None)
+
+    # 🔹 "cache": false opts the chat out of shared cached replies from now on
+    if use_cache is not None and bool(use_cache) != chat.response_cache_enabled:
+        chat.response_cache_enabled = bool(use_cache)
+        ChatSession.objects(id=chat.id).update_one(
+            set__response_cache_enabled=chat.response_cache_enabled
+        )
+
     # 🔹 Save user message
-    user_msg = Message(
-        chat=chat,
-        role="user",
-        content=message_text
-    )
-    user_msg.save()
+    if not (record and record.user_message_id):
+        message = save_message(chat, "user", message_text)
 
-    # 🔥 Fetch full conversation (INCLUDING current message)
-    previous_messages = Message.objects(chat=chat).order_by("created_at")
+        if record:
+            idempotency.save_progress(record, user_message_id=message.id)
 
-    conversation_history = []
+    # 🔹 Hand generation to the job queue and return at once if asked to;
+    # the client polls GET /api/chat/jobs/<job_id>/ for the reply
+    if request.data.get("async"):
+        job = enqueue_generation(chat, user)
+        return Response({
+            "chat_id": str(chat.id),
+            "job_id": str(job.id),
+            "status": job.status
+        }, status=202)
 
-    for msg in previous_messages:
-        conversation_history.append({
-            "role": msg.role,      # must be "user" or "assistant"
-            "content": msg.content # must be "content", not "parts"
-        })
+    # 🔥 Unsummarized turns verbatim (INCLUDING current message) + summary of older ones
+    conversation_history, whole_chat = build_conversation(chat)
+
+    # Only a reply to the whole chat may be shared with other chats
+    use_cache = chat.response_cache_enabled and whole_chat
 
     print("====== FULL MESSAGE PAYLOAD ======")
     for m in conversation_history:
         print(m["role"], ":", m["content"][:80])
     print("===================================")
 
+    # 🔹 Stream tokens as they arrive if the client asked for it
+    if request.data.get("stream"):
+        return stream_reply(chat, conversation_history, finish, record, use_cache)
+
     # 🔥 Call HuggingFace with FULL history
     try:
-        ai_response = generate_ai_response(conversation_history)
+        ai_response = generate_ai_response(conversation_history, use_cache=use_cache)
 
         if isinstance(ai_response, dict) and "error" in ai_response:
             return Response(ai_response, status=500)
 
         ai_response_text = ai_response
 
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
-    # 🔹 Save assistant reply
-    ai_msg = Message(
-        chat=chat,
-        role="assistant",
-        content=ai_response_text
-    )
-    ai_msg.save()
+    # 🔹 Save assistant reply, then fold older turns into the summary off
+    # the request path
+    save_message(chat, "assistant", ai_response_text)
+    schedule_fold(chat)
 
     return Response({
         "chat_id": str(chat.id),
         "reply": ai_response_text
     })
 
+@api_view(["GET"])
+def get_generation_job(request, job_id):
+    user = get_user_from_request(request, trust_claims=True)
+
+    if not user:
+        return Response({"error": "Unauthorized"}, status=401)
+
+    try:
+        job = GenerationJob.objects(id=ObjectId(job_id), user=user).first()
+    except InvalidId:
+        job = None
+
+    if not job:
+        return Response({"error": "Job not found"}, status=404)
+
+    data = {
+        "job_id": str(job.id),
+        "chat_id": str(job.chat.pk),
+        "status": job.status
+    }
+
+    if job.status == "done":
+        data["reply"] = job.reply.content
+    elif job.status == "failed":
+        data["error"] = job.error
+
+    return Response(data)
+
 @api_view(["GET"])
 def get_chat_history(request, chat_id):
-    user = get_user_from_request(request)
+    """
+    Messages of a chat, oldest first.
+
+    - ``?limit=N&cursor=...`` pages forward from the start of the chat.
+    - ``?latest=N&cursor=...`` returns the newest N messages, and pages
+      backwards towards older ones (for a chat UI loading from the bottom).
+    - Without either, old clients get the latest CHAT_HISTORY_MAX_MESSAGES.
+
+    ``next_cursor`` is None once there is nothing more to load.
+    """
+    # Only used to scope queries, so the verified token is enough
+    user = get_user_from_request(request, trust_claims=True)
 
     if not user:
         return Response({"error": "Unauthorized"}, status=401)
 
-    chat = ChatSession.objects(id=ObjectId(chat_id), user=user).first()
+    raw = settings.CHAT_RAW_READS
+    chat_id = ObjectId(chat_id)
+    chats = ChatSession.objects(id=chat_id, user=user)
 
-    if not chat:
+    # Only existence matters; the chat may carry a long summary
+    if not (chats.only("id").as_pymongo().first() if raw else chats.first()):
         return Response({"error": "Chat not found"}, status=404)
 
-    messages = Message.objects(chat=chat).order_by("created_at")
+    cursor = request.query_params.get("cursor")
+    latest = "limit" not in request.query_params
 
-    data = [
-        {
-            "role": msg.role,
-            "content": msg.content
-        }
-        for msg in messages
-    ]
+    try:
+        if latest:
+            limit = parse_limit(
+                request.query_params.get("latest"),
+                default=settings.CHAT_HISTORY_MAX_MESSAGES,
+                maximum=settings.CHAT_HISTORY_MAX_MESSAGES
+            )
+        else:
+            limit = parse_limit(
+                request.query_params.get("limit"),
+                default=settings.CHAT_PAGE_SIZE,
+                maximum=settings.CHAT_HISTORY_MAX_MESSAGES
+            )
+
+        messages = Message.objects(chat=chat_id).only("role", "content", "created_at")
+
+        messages, next_cursor = keyset_page(
+            messages.as_pymongo() if raw else messages,
+            "created_at",
+            limit,
+            cursor=cursor,
+            descending=latest
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    if latest:
+        messages.reverse()
+
+    if raw:
+        data = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+    else:
+        data = [
+            {
+                "role": msg.role,
+                "content": msg.content
+            }
+            for msg in messages
+        ]
 
     return Response({
-        "chat_id": str(chat.id),
-        "messages": data
+        "chat_id": str(chat_id),
+        "messages": data,
+        "next_cursor": next_cursor
     })
 
+@api_view(["GET"])
+def export_chats(request, chat_id=None):
+    """
+    Stream one chat, or all of the user's chats, as NDJSON (see chat.export).
+
+    Memory stays flat however long the chats are, so this is the way to
+    fetch a complete history.
+    """
+    user = get_user_from_request(request, trust_claims=True)
+
+    if not user:
+        return Response({"error": "Unauthorized"}, status=401)
+
+    if chat_id is not None:
+        try:
+            chat_id = ObjectId(chat_id)
+        except InvalidId:
+            return Response({"error": "Chat not found"}, status=404)
+
+        if not ChatSession.objects(id=chat_id, user=user).count():
+            return Response({"error": "Chat not found"}, status=404)
+
+    filename = f"chat-{chat_id}.ndjson" if chat_id else "chats.ndjson"
+
+    response = StreamingHttpResponse(export_lines(user, chat_id), content_type="application/x-ndjson")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["X-Accel-Buffering"] = "no"
+    return response
+
 @api_view(["GET"])
 def list_user_chats(request):
-    user = get_user_from_request(request)
+    """
+    The user's chats, most recently active first, with a preview of the
+    last message and the message count.
+
+    With ``?limit=N&cursor=...`` returns ``{"chats": [...], "next_cursor": ...}``;
+    without it, old clients get a plain list of at most CHAT_LIST_MAX_CHATS.
+    """
+    user = get_user_from_request(request, trust_claims=True)
 
     if not user:
         return Response({"error": "Unauthorized"}, status=401)
 
-    chats = ChatSession.objects(user=user).order_by("-created_at")
+    paginated = "limit" in request.query_params
 
-    data = [
-        {
-            "chat_id": str(chat.id),
-            "title": chat.title,
-            "created_at": chat.created_at
-        }
-        for chat in chats
-    ]
+    try:
+        limit = parse_limit(
+            request.query_params.get("limit"),
+            default=settings.CHAT_LIST_MAX_CHATS,
+            maximum=settings.CHAT_LIST_MAX_CHATS
+        )
 
-    return Response(data)
+        chats = ChatSession.objects(user=user).only(
+            "title", "created_at", "updated_at", "message_count", "last_message_preview"
+        )
+
+        chats, next_cursor = keyset_page(
+            chats.as_pymongo() if settings.CHAT_RAW_READS else chats,
+            "updated_at",
+            limit,
+            cursor=request.query_params.get("cursor") if paginated else None,
+            descending=True
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    if settings.CHAT_RAW_READS:
+        data = [
+            {
+                "chat_id": str(chat["_id"]),
+                "title": chat.get("title"),
+                "created_at": chat.get("created_at"),
+                "updated_at": chat.get("updated_at") or chat.get("created_at"),
+                "message_count": chat.get("message_count", 0),
+                "last_message_preview": chat.get("last_message_preview")
+            }
+            for chat in chats
+        ]
+    else:
+        data = [
+            {
+                "chat_id": str(chat.id),
+                "title": chat.title,
+                "created_at": chat.created_at,
+                "updated_at": chat.updated_at or chat.created_at,
+                "message_count": chat.message_count,
+                "last_message_preview": chat.last_message_preview
+            }
+            for chat in chats
+        ]
+
+    if not paginated:
+        return Response(data)
+
+    return Response({
+        "chats": data,
+        "next_cursor": next_cursor
+    })
 
 @api_view(["DELETE"])
 def delete_chat(request, chat_id):
-    user = get_user_from_request(request)
+    user = get_user_from_request(request, trust_claims=True)
 
     if not user:
         return Response({"error": "Unauthorized"}, status=401)
@@ -150,53 +531,102 @@ def delete_chat(request, chat_id):
 
     return Response({"message": "Chat deleted successfully"})
 
-def get_wikipedia_image(name):
-    try:
-        url = f"https://en.wikipedia.org/api/rest_v1/page/summary/{name}"
-        res = requests.get(url)
-        data = res.json()
-        return data.get("thumbnail", {}).get("source")
-    except:
+# Image URLs for places, shared by all workers. Misses (no photo found) are
+# cached for a shorter time; upstream errors are not cached at all.
+image_cache = TwoTierCache(
+    "images",
+    ttl=settings.IMAGE_CACHE_TTL,
+    negative_ttl=settings.IMAGE_CACHE_NEGATIVE_TTL,
+    maxsize=settings.IMAGE_CACHE_SIZE
+)
+
+
+def fetch_wikipedia_image(name):
+    url = f"{settings.WIKIPEDIA_API_URL}/api/rest_v1/page/summary/{name}"
+    res = upstream("wikipedia").get(url)
+
+    if res.status_code == 404:
         return None
-    
-def get_unsplash_image(query):
-    try:
-        url = "https://api.unsplash.com/photos/random"
-        headers = {
-            "Authorization": f"Client-ID {settings.UNSPLASH_ACCESS_KEY}"
-        }
-        params = {"query": query}
-        res = requests.get(url, headers=headers, params=params)
-        data = res.json()
-        return data.get("urls", {}).get("regular")
-    except:
+
+    res.raise_for_status()
+    data = res.json()
+    return data.get("thumbnail", {}).get("source")
+
+
+def fetch_unsplash_image(query):
+    url = f"{settings.UNSPLASH_API_URL}/photos/random"
+    headers = {
+        "Authorization": f"Client-ID {settings.UNSPLASH_ACCESS_KEY}"
+    }
+    params = {"query": query}
+    res = upstream("unsplash").get(url, headers=headers, params=params)
+
+    if res.status_code == 404:
         return None
 
-def get_pexels_image(query):
-    try:
-        url = "https://api.pexels.com/v1/search"
+    res.raise_for_status()
+    data = res.json()
+    return data.get("urls", {}).get("regular")
 
-        headers = {
-            "Authorization": settings.PEXELS_API_KEY
-        }
 
-        params = {
-            "query": query,
-            "per_page": 1,
-            "orientation": "landscape"
-        }
+def pexels_request(query):
+    url = f"{settings.PEXELS_API_URL}/v1/search"
+
+    headers = {
+        "Authorization": settings.PEXELS_API_KEY
+    }
+
+    params = {
+        "query": query,
+        "per_page": 1,
+        "orientation": "landscape"
+    }
+
+    return url, {"headers": headers, "params": params}
 
-        response = requests.get(url, headers=headers, params=params)
 
-        if response.status_code == 200:
-            data = response.json()
-            photos = data.get("photos")
+def parse_pexels_image(data):
+    photos = data.get("photos")
 
-            if photos:
-                return photos[0]["src"]["large"]
+    if photos:
+        return photos[0]["src"]["large"]
 
+    return None
+
+
+def fetch_pexels_image(query):
+    url, kwargs = pexels_request(query)
+
+    response = upstream("pexels").get(url, **kwargs)
+    response.raise_for_status()
+
+    return parse_pexels_image(response.json())
+
+
+def get_wikipedia_image(name):
+    try:
+        return image_cache.get_or_set(
+            f"wikipedia:{normalize_query(name)}",
+            lambda: fetch_wikipedia_image(name)
+        )
+    except Exception:
         return None
 
+def get_unsplash_image(query):
+    try:
+        return image_cache.get_or_set(
+            f"unsplash:{normalize_query(query)}",
+            lambda: fetch_unsplash_image(query)
+        )
+    except Exception:
+        return None
+
+def get_pexels_image(query):
+    try:
+        return image_cache.get_or_set(
+            f"pexels:{normalize_query(query)}",
+            lambda: fetch_pexels_image(query)
+        )
     except Exception as e:
         print("Pexels error:", e)
         return None
@@ -207,6 +637,42 @@ def get_place_image(name, category):
         return wiki
     return get_unsplash_image(category)
 
+FALLBACK_IMAGE = "https://images.pexels.com/photos/2662116/pexels-photo-2662116.jpeg"
+
+# Shared across requests so the number of concurrent Pexels calls stays bounded
+image_pool = ThreadPoolExecutor(
+    max_workers=settings.NEARBY_IMAGE_WORKERS,
+    thread_name_prefix="place-images"
+)
+
+
+def fetch_place_images(queries, deadline=None):
+    """
+    Look up one image per query concurrently.
+
+    Waits at most ``deadline`` seconds overall; any lookup that has not
+    finished by then (or found nothing) gets FALLBACK_IMAGE. Late lookups
+    keep running in the pool but no longer hold up the response.
+    """
+    if deadline is None:
+        deadline = settings.NEARBY_IMAGE_DEADLINE
+
+    # Each lookup runs in a copy of this request's context, so its Mongo and
+    # HTTP time is still attributed to the request
+    futures = [
+        image_pool.submit(contextvars.copy_context().run, get_pexels_image, query)
+        for query in queries
+    ]
+    done, _ = wait(futures, timeout=deadline)
+
+    images = []
+
+    for future in futures:
+        image = future.result() if future in done else None
+        images.append(image or FALLBACK_IMAGE)
+
+    return images
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     R = 6371  # Earth radius in km
 
@@ -220,98 +686,278 @@ def calculate_distance(lat1, lon1, lat2, lon2):
 
     return round(R * c, 2)
 
-@api_view(["POST"])
-def nearby_places(request):
-    lat = request.data.get("latitude")
-    lon = request.data.get("longitude")
+NEARBY_RADIUS_M = 2000
+NEARBY_DEFAULT_LIMIT = 8
 
-    if lat is None or lon is None:
-        return Response({"error": "Location required"}, status=400)
+# Searches are shared per geohash cell; the cell is chosen so it is no wider
+# than the search radius, and searched with the radius padded to cover it.
+NEARBY_CELL_PRECISION = precision_for_radius(NEARBY_RADIUS_M)
 
-    try:
-        lat = float(lat)
-        lon = float(lon)
-    except ValueError:
-        return Response({"error": "Invalid coordinates"}, status=400)
+nearby_cache = TwoTierCache(
+    "nearby",
+    ttl=settings.NEARBY_CACHE_TTL,
+    maxsize=settings.NEARBY_CACHE_SIZE
+)
+
+
+def normalize_category(category):
+    category_lower = category.lower()
 
-    url = "https://api.tomtom.com/search/2/nearbySearch/.json"
+    if "restaurant" in category_lower or "indian" in category_lower:
+        return "restaurant"
+    elif "park" in category_lower:
+        return "park"
+    elif "attraction" in category_lower:
+        return "tourist attraction"
+    elif "amusement" in category_lower:
+        return "amusement park"
+    else:
+        return "place"
+
+
+def nearby_search_request(cell):
+    center_lat, center_lon = geohash_center(cell)
+
+    url = f"{settings.TOMTOM_API_URL}/search/2/nearbySearch/.json"
 
     params = {
-        "lat": lat,
-        "lon": lon,
-        "radius": 2000,
+        "lat": center_lat,
+        "lon": center_lon,
+        "radius": round(NEARBY_RADIUS_M + cell_half_diagonal_m(NEARBY_CELL_PRECISION)),
+        "limit": settings.NEARBY_FETCH_LIMIT,
         "categorySet": "7315,7376,7372,9362",
         "key": settings.TOMTOM_API_KEY
     }
 
-    try:
-        response = requests.get(url, params=params)
-        data = response.json()
-    except Exception as e:
-        return Response({"error": "TomTom API failed"}, status=500)
+    return url, {"params": params}
 
-    results = []
 
-    for place in data.get("results", [])[:8]:
-        name = place.get("poi", {}).get("name", "Unknown Place")
-        categories = place.get("poi", {}).get("categories", [])
-        category = categories[0] if categories else "place"
-
-        # Normalize category
-        category_lower = category.lower()
-
-        if "restaurant" in category_lower or "indian" in category_lower:
-            category = "restaurant"
-        elif "park" in category_lower:
-            category = "park"
-        elif "attraction" in category_lower:
-            category = "tourist attraction"
-        elif "amusement" in category_lower:
-            category = "amusement park"
-        else:
-            category = "place"
+def parse_nearby_results(data):
+    places = []
 
+    for place in data.get("results", []):
         latitude = place.get("position", {}).get("lat")
         longitude = place.get("position", {}).get("lon")
 
         if latitude is None or longitude is None:
             continue
 
-        distance = calculate_distance(lat, lon, latitude, longitude)
+        categories = place.get("poi", {}).get("categories", [])
 
-        # 🔥 Better Pexels search query
-        # Better search query
-        search_query = f"{name} {category}"
+        places.append({
+            "id": place.get("id"),
+            "name": place.get("poi", {}).get("name", "Unknown Place"),
+            "category": normalize_category(categories[0] if categories else "place"),
+            "latitude": latitude,
+            "longitude": longitude
+        })
 
-        image = get_pexels_image(search_query)
+    return places
 
-        # Fallback only if Pexels fails
-        if not image:
-            image = "https://images.pexels.com/photos/2662116/pexels-photo-2662116.jpeg"
 
-        # Fallback if Pexels fails
-        if not image:
-            image = "https://images.pexels.com/photos/2662116/pexels-photo-2662116.jpeg"
+def search_nearby_cell(cell):
+    """
+    Search TomTom around the centre of a geohash cell.
 
-        results.append({
-            "name": name,
-            "category": category,
-            "latitude": latitude,
-            "longitude": longitude,
+    Returns normalized POIs (without distances) covering everything within
+    NEARBY_RADIUS_M of any point in the cell.
+    """
+    url, kwargs = nearby_search_request(cell)
+
+    response = upstream("tomtom").get(url, **kwargs)
+    response.raise_for_status()
+
+    return parse_nearby_results(response.json())
+
+
+def load_nearby_cell(cell):
+    """
+    Candidates for a cell: from the local POI store when the cell has fresh
+    coverage, otherwise from TomTom, storing what it returns.
+    """
+    if not settings.PLACE_STORE_ENABLED:
+        return search_nearby_cell(cell)
+
+    try:
+        if place_store.has_fresh_coverage(cell):
+            center_lat, center_lon = geohash_center(cell)
+            return place_store.places_near(
+                center_lat,
+                center_lon,
+                NEARBY_RADIUS_M + cell_half_diagonal_m(NEARBY_CELL_PRECISION),
+                settings.NEARBY_FETCH_LIMIT
+            )
+    except Exception as e:
+        print("Place store error:", e)
+
+    places = search_nearby_cell(cell)
+
+    try:
+        place_store.store_places(cell, places)
+    except Exception as e:
+        print("Place store error:", e)
+
+    return places
+
+
+def get_nearby_candidates(lat, lon):
+    cell = geohash_encode(lat, lon, NEARBY_CELL_PRECISION)
+    return nearby_cache.get_or_set(cell, lambda: load_nearby_cell(cell))
+
+
+def rank_by_distance(lat, lon, places, max_distance_km):
+    """Return ``(place, distance_km)`` for places within ``max_distance_km``, nearest first."""
+    if not places:
+        return []
+
+    distances = haversine_km(
+        lat,
+        lon,
+        [place["latitude"] for place in places],
+        [place["longitude"] for place in places]
+    )
+
+    # Stable sort keeps upstream relevance order between equal distances
+    order = np.argsort(distances, kind="stable")
+
+    return [
+        (places[i], float(distances[i]))
+        for i in order
+        if distances[i] <= max_distance_km
+    ]
+
+
+def parse_max_distance(value):
+    """Parse ``max_distance_km``; searches only reach NEARBY_RADIUS_M, so it is clamped to that."""
+    radius_km = NEARBY_RADIUS_M / 1000
+
+    if value in (None, ""):
+        return radius_km
+
+    try:
+        max_distance = float(value)
+    except (TypeError, ValueError):
+        max_distance = 0
+
+    if not max_distance > 0:
+        raise ValueError("max_distance_km must be a positive number")
+
+    return min(max_distance, radius_km)
+
+
+def parse_nearby_request(data):
+    """``(lat, lon, limit, offset, max_distance_km)`` from a nearby request; raise ValueError."""
+    lat = data.get("latitude")
+    lon = data.get("longitude")
+
+    if lat is None or lon is None:
+        raise ValueError("Location required")
+
+    try:
+        lat = float(lat)
+        lon = float(lon)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid coordinates")
+
+    limit = parse_limit(
+        data.get("limit"),
+        default=NEARBY_DEFAULT_LIMIT,
+        maximum=settings.NEARBY_FETCH_LIMIT
+    )
+    offset = parse_offset(data.get("offset"))
+    max_distance_km = parse_max_distance(data.get("max_distance_km"))
+
+    return lat, lon, limit, offset, max_distance_km
+
+
+def nearby_results(lat, lon, candidates, limit, offset, max_distance_km):
+    """The requested page of ``(place, distance)`` pairs and the response entries for it."""
+    # Cached searches cover the whole cell, so measure from the caller
+    ranked = rank_by_distance(lat, lon, candidates, max_distance_km)
+
+    page = ranked[offset:offset + limit]
+
+    results = [
+        {
+            "name": place["name"],
+            "category": place["category"],
+            "latitude": place["latitude"],
+            "longitude": place["longitude"],
             "distance_km": round(distance, 2),
-            "image": image
-        })
+            "image": place.get("image")
+        }
+        for place, distance in page
+    ]
+
+    return page, results
+
+
+def missing_images(results):
+    """Indexes of results without a stored image, and the image search query for each."""
+    # 🔥 Better Pexels search query
+    missing = [i for i, result in enumerate(results) if not result["image"]]
+    search_queries = [f"{results[i]['name']} {results[i]['category']}" for i in missing]
+    return missing, search_queries
+
+
+def apply_place_images(page, results, missing, images):
+    """Fill in fetched images and remember the real ones in the place store."""
+    found = {}
+
+    for i, image in zip(missing, images):
+        results[i]["image"] = image
+
+        if image != FALLBACK_IMAGE and page[i][0].get("id"):
+            found[page[i][0]["id"]] = image
+
+    if settings.PLACE_STORE_ENABLED and found:
+        try:
+            place_store.save_images(found)
+        except Exception as e:
+            print("Place store error:", e)
 
-    return Response(results)
 
 @api_view(["POST"])
-def geocode_location(request):
-    query = request.data.get("query")
+def nearby_places(request):
+    try:
+        lat, lon, limit, offset, max_distance_km = parse_nearby_request(request.data)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
 
-    if not query:
-        return Response({"error": "Location query required"}, status=400)
+    try:
+        candidates = get_nearby_candidates(lat, lon)
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
+    except Exception as e:
+        return Response({"error": "TomTom API failed"}, status=500)
+
+    page, results = nearby_results(lat, lon, candidates, limit, offset, max_distance_km)
+
+    # Fetched at once for places without a stored image
+    missing, search_queries = missing_images(results)
+    apply_place_images(page, results, missing, fetch_place_images(search_queries))
+
+    return Response(results)
+
+# Geocoding answers, shared by all workers through the Mongo tier.
+# "Location not found" is cached as None for the shorter negative TTL.
+geocode_cache = TwoTierCache(
+    "geocode",
+    ttl=settings.GEOCODE_CACHE_TTL,
+    negative_ttl=settings.GEOCODE_CACHE_NEGATIVE_TTL,
+    maxsize=settings.GEOCODE_CACHE_SIZE
+)
+
+reverse_geocode_cache = TwoTierCache(
+    "reverse_geocode",
+    ttl=settings.GEOCODE_CACHE_TTL,
+    negative_ttl=settings.GEOCODE_CACHE_NEGATIVE_TTL,
+    maxsize=settings.GEOCODE_CACHE_SIZE
+)
 
-    url = "https://api.tomtom.com/search/2/geocode/.json"
+
+def geocode_request(query):
+    url = f"{settings.TOMTOM_API_URL}/search/2/geocode/.json"
 
     params = {
         "key": settings.TOMTOM_API_KEY,
@@ -319,48 +965,47 @@ def geocode_location(request):
         "limit": 1
     }
 
-    try:
-        response = requests.get(url, params=params)
-        data = response.json()
-    except Exception as e:
-        return Response({"error": str(e)}, status=500)
+    return url, {"params": params}
+
 
+def parse_geocode(data):
     results = data.get("results", [])
 
     if not results:
-        return Response({"error": "Location not found"}, status=404)
+        return None
 
     position = results[0]["position"]
 
-    return Response({
+    return {
         "latitude": position["lat"],
         "longitude": position["lon"]
-    })
+    }
 
-@api_view(["POST"])
-def reverse_geocode(request):
-    lat = request.data.get("latitude")
-    lon = request.data.get("longitude")
 
-    if lat is None or lon is None:
-        return Response({"error": "Coordinates required"}, status=400)
+def fetch_geocode(query):
+    url, kwargs = geocode_request(query)
 
-    url = f"https://api.tomtom.com/search/2/reverseGeocode/{lat},{lon}.json"
+    response = upstream("tomtom").get(url, **kwargs)
+    response.raise_for_status()
+
+    return parse_geocode(response.json())
+
+
+def reverse_geocode_request(lat, lon):
+    url = f"{settings.TOMTOM_API_URL}/search/2/reverseGeocode/{lat},{lon}.json"
 
     params = {
         "key": settings.TOMTOM_API_KEY
     }
 
-    try:
-        response = requests.get(url, params=params)
-        data = response.json()
-    except Exception as e:
-        return Response({"error": str(e)}, status=500)
+    return url, {"params": params}
+
 
+def parse_reverse_geocode(data):
     addresses = data.get("addresses", [])
 
     if not addresses:
-        return Response({"error": "Location not found"}, status=404)
+        return None
 
     address = addresses[0].get("address", {})
 
@@ -371,8 +1016,79 @@ def reverse_geocode(request):
         or address.get("countrySecondarySubdivision")
     )
 
-    return Response({
+    return {
         "city": city,
         "state": address.get("countrySubdivision"),
         "country": address.get("country")
-    })
\ No newline at end of file
+    }
+
+
+def fetch_reverse_geocode(lat, lon):
+    url, kwargs = reverse_geocode_request(lat, lon)
+
+    response = upstream("tomtom").get(url, **kwargs)
+    response.raise_for_status()
+
+    return parse_reverse_geocode(response.json())
+
+
+@api_view(["POST"])
+def geocode_location(request):
+    query = request.data.get("query")
+
+    if not query:
+        return Response({"error": "Location query required"}, status=400)
+
+    try:
+        location = geocode_cache.get_or_set(
+            normalize_query(query),
+            lambda: fetch_geocode(query)
+        )
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
+    except Exception as e:
+        # Not str(e): upstream error messages include the URL and its API key
+        print("TomTom error:", e)
+        return Response({"error": "TomTom API failed"}, status=500)
+
+    if not location:
+        return Response({"error": "Location not found"}, status=404)
+
+    return Response(location)
+
+@api_view(["POST"])
+def reverse_geocode(request):
+    lat = request.data.get("latitude")
+    lon = request.data.get("longitude")
+
+    if lat is None or lon is None:
+        return Response({"error": "Coordinates required"}, status=400)
+
+    try:
+        # A moving client sends a slightly different fix every few seconds;
+        # rounding lets those share one lookup (3 decimals is about 100 m)
+        precision = settings.REVERSE_GEOCODE_PRECISION
+        lat = round(float(lat), precision)
+        lon = round(float(lon), precision)
+    except (TypeError, ValueError):
+        return Response({"error": "Invalid coordinates"}, status=400)
+
+    try:
+        address = reverse_geocode_cache.get_or_set(
+            f"{lat:.{precision}f},{lon:.{precision}f}",
+            lambda: fetch_reverse_geocode(lat, lon)
+        )
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
+    except Exception as e:
+        print("TomTom error:", e)
+        return Response({"error": "TomTom API failed"}, status=500)
+
+    if not address:
+        return Response({"error": "Location not found"}, status=404)
+
+    return Response(address)
+
+@api_view(["GET"])
+def get_cache_stats(request):
+    return Response(cache_stats())
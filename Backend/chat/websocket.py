@@ -0,0 +1,261 @@
+"""
+WebSocket chat transport, mounted by core.asgi at CHAT_SOCKET_PATH.
+
+A connection authenticates once, with ``?token=<jwt>`` (browsers cannot
+set headers on a WebSocket) or an Authorization header, then carries any
+number of turns:
+
+    -> {"message": "...", "chat_id": "...", "new_chat": false, "cache": true}
+    <- {"type": "start", "chat_id": "..."}
+    <- {"type": "token", "token": "..."}
+    <- {"type": "done", "chat_id": "..."}
+    <- {"type": "error", "error": "..."}
+
+Without ``chat_id`` a turn continues the connection's current chat, or
+starts one (as does ``new_chat``). The connection keeps that chat and its
+unsummarized messages in memory, so the chat and its history are read only
+when a turn switches chats; otherwise a turn's database work is writing its
+two messages. Messages added to the same chat over HTTP while the socket is
+open are not seen by it.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from core.metrics import Counter
+from core.mongo import ainsert, collection
+from users.auth_utils import authenticate_token, AuthError
+from .admission import admit, AdmissionRejected
+from .async_views import in_thread
+from .context import conversation_from, fold_messages
+from .gemini_service import astream_ai_response
+from .messages import asave_message
+from .models import ChatSession, Message
+
+CHAT_SOCKET_PATH = "/ws/chat/"
+
+# Application close code, sent instead of accepting the connection
+CLOSE_UNAUTHORIZED = 4401
+
+SOCKET_TURNS = Counter(
+    "chat_socket_turns_total",
+    "Chat turns taken over the WebSocket transport, by outcome.",
+    labelnames=("outcome",)
+)
+
+
+def socket_token(scope):
+    """The JWT a WebSocket handshake carries, from the query string or headers."""
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+
+    if query.get("token"):
+        return query["token"][0]
+
+    headers = dict(scope.get("headers", []))
+    parts = headers.get(b"authorization", b"").decode("latin-1").split()
+
+    return parts[1] if len(parts) == 2 else None
+
+
+class ChatConnection:
+    """One socket's user, current chat and in-memory history window."""
+
+    def __init__(self, user, send):
+        self.user = user
+        self._send = send
+        self.gone = asyncio.Event()
+        self.chat = None
+        self.messages = []
+        # The summary fold started after the last reply; awaited before
+        # the next turn reads the chat
+        self.folding = None
+
+    async def emit(self, event, **data):
+        if self.gone.is_set():
+            return
+
+        try:
+            await self._send({"type": "websocket.send", "text": json.dumps({"type": event, **data})})
+        except OSError:
+            # The client went away mid-send
+            self.gone.set()
+
+    async def open_chat(self, chat_id):
+        """Load ``chat_id`` and its unsummarized messages; False if the user has no such chat."""
+        try:
+            raw = await collection(ChatSession).find_one({"_id": ObjectId(chat_id), "user": self.user.id})
+        except (InvalidId, TypeError):
+            raw = None
+
+        if not raw:
+            return False
+
+        chat = ChatSession._from_son(raw)
+        query = {"chat": chat.id}
+
+        if chat.summary_until:
+            query["created_at"] = {"$gt": chat.summary_until}
+
+        cursor = collection(Message).find(
+            query, {"role": 1, "content": 1, "created_at": 1}
+        ).sort("created_at", 1)
+
+        self.chat = chat
+        self.messages = [Message._from_son(raw) async for raw in cursor]
+        return True
+
+    async def take_turn(self, text):
+        try:
+            data = json.loads(text or "")
+            if not isinstance(data, dict):
+                raise ValueError
+        except ValueError:
+            await self.emit("error", error="Invalid JSON body")
+            return
+
+        message_text = data.get("message")
+
+        if not message_text or not isinstance(message_text, str):
+            await self.emit("error", error="Message is required")
+            return
+
+        try:
+            ticket = await in_thread(admit)(str(self.user.id))
+        except AdmissionRejected as e:
+            SOCKET_TURNS.inc(outcome="rejected")
+            await self.emit("error", error=str(e), reason=e.reason, retry_after=e.retry_after)
+            return
+
+        try:
+            await self.reply(data, message_text)
+        finally:
+            ticket.release()
+
+    async def reply(self, data, message_text):
+        if self.folding:
+            folding, self.folding = self.folding, None
+
+            try:
+                self.messages = await folding
+            except Exception as e:
+                # The window is still correct, just not yet summarized
+                print("Summary error:", e)
+
+        chat_id = data.get("chat_id")
+
+        if chat_id and (self.chat is None or str(chat_id) != str(self.chat.id)):
+            if not await self.open_chat(chat_id):
+                SOCKET_TURNS.inc(outcome="not_found")
+                await self.emit("error", error="Chat not found")
+                return
+        elif self.chat is None or data.get("new_chat"):
+            self.chat = await ainsert(ChatSession(user=self.user, title=message_text[:30]))
+            self.messages = []
+
+        chat = self.chat
+        use_cache = data.get("cache")
+
+        if use_cache is not None and bool(use_cache) != chat.response_cache_enabled:
+            chat.response_cache_enabled = bool(use_cache)
+            await collection(ChatSession).update_one(
+                {"_id": chat.id},
+                {"$set": {"response_cache_enabled": chat.response_cache_enabled}}
+            )
+
+        message = await asave_message(chat, "user", message_text)
+        self.messages.append(message)
+
+        conversation_history, whole_chat = conversation_from(chat, self.messages)
+
+        chunks = []
+
+        try:
+            await self.emit("start", chat_id=str(chat.id))
+
+            tokens = astream_ai_response(
+                conversation_history,
+                use_cache=chat.response_cache_enabled and whole_chat
+            )
+
+            try:
+                async for token in tokens:
+                    if self.gone.is_set():
+                        break
+
+                    chunks.append(token)
+                    await self.emit("token", token=token)
+            finally:
+                await tokens.aclose()
+
+            await self.emit("done", chat_id=str(chat.id))
+            SOCKET_TURNS.inc(outcome="done" if not self.gone.is_set() else "disconnected")
+
+        except Exception as e:
+            SOCKET_TURNS.inc(outcome="error")
+            await self.emit("error", error=str(e), chat_id=str(chat.id))
+
+        finally:
+            # Like the SSE stream, keep whatever part of the reply was sent
+            if chunks:
+                reply = await asave_message(chat, "assistant", "".join(chunks))
+                self.messages.append(reply)
+
+                # May fold older messages into the chat summary, which
+                # writes it back; runs while the client reads the reply
+                self.folding = asyncio.ensure_future(
+                    in_thread(fold_messages)(chat, list(self.messages))
+                )
+
+
+async def read_turns(receive, connection, turns):
+    """Queue incoming texts for the turn loop; ``None`` once the client disconnects."""
+    while True:
+        event = await receive()
+
+        if event["type"] == "websocket.receive":
+            text = event.get("text")
+            if text is None and event.get("bytes") is not None:
+                text = event["bytes"].decode("utf-8", errors="replace")
+            await turns.put(text)
+
+        elif event["type"] == "websocket.disconnect":
+            connection.gone.set()
+            await turns.put(None)
+            return
+
+
+async def chat_socket(scope, receive, send):
+    """ASGI app for CHAT_SOCKET_PATH; turns on one socket are answered in order."""
+    if (await receive())["type"] != "websocket.connect":
+        return
+
+    token = socket_token(scope)
+
+    try:
+        if not token:
+            raise AuthError("Authorization token missing")
+
+        user = await in_thread(authenticate_token)(token)
+    except AuthError:
+        await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+        return
+
+    await send({"type": "websocket.accept"})
+
+    connection = ChatConnection(user, send)
+    turns = asyncio.Queue()
+    reader = asyncio.ensure_future(read_turns(receive, connection, turns))
+
+    try:
+        while True:
+            text = await turns.get()
+
+            if text is None:
+                break
+
+            await connection.take_turn(text)
+    finally:
+        reader.cancel()
@@ -2,6 +2,8 @@
 ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+WebSocket connections to the chat socket path go to chat.websocket; every
+other request goes to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,20 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, as it loads models
+from chat.websocket import CHAT_SOCKET_PATH, chat_socket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        if scope["path"] == CHAT_SOCKET_PATH:
+            return await chat_socket(scope, receive, send)
+
+        # Django cannot serve WebSockets; refuse the handshake
+        await receive()
+        await send({"type": "websocket.close"})
+        return
+
+    return await django_application(scope, receive, send)
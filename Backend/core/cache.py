@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by cache lookups on a miss, so that a cached None can be told apart
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry time to live.
+
+    Holds at most ``maxsize`` entries; the least recently used one is
+    evicted first. Expired entries are dropped lazily when looked up.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is not None:
+                value, expires_at = entry
+
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+                del self._data[key]
+
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,70 @@
+"""
+orjson-based drop-ins for DRF's JSONRenderer and JSONParser, enabled in
+REST_FRAMEWORK when FAST_JSON is on and orjson is installed.
+
+Responses decode to the same values JSONRenderer's do. Payloads orjson
+cannot encode (e.g. integers beyond 64 bits) and ``indent`` requests fall
+back to the stock renderer, as do non-UTF-8 bodies to the stock parser.
+"""
+import orjson
+from bson import ObjectId
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# orjson formats datetimes as DRF's encoder does (isoformat, "Z" for UTC)
+DUMPS_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+class ObjectIdEncoder(JSONEncoder):
+    """DRF's encoder, plus ObjectIds; used for the values orjson hands back."""
+
+    def default(self, obj):
+        if isinstance(obj, ObjectId):
+            return str(obj)
+
+        return super().default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    # Also used by the stock render() this falls back to
+    encoder_class = ObjectIdEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        if self.ensure_ascii or not self.compact or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=DUMPS_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escaped like JSONRenderer, so the output is a strict JavaScript
+        # subset. A one-byte search (memchr) for the characters' last UTF-8
+        # byte is far cheaper than replace() on long bodies that have neither
+        if b"\xa8" in ret or b"\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+
+        # orjson only reads UTF-8, and never accepts NaN or Infinity
+        if encoding.lower().replace("_", "-") not in ("utf-8", "utf8") or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
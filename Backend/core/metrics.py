@@ -0,0 +1,254 @@
+"""
+Process-wide performance metrics, rendered in the Prometheus text format.
+
+Besides the histograms and counters, a per-request ``RequestTimings`` is kept
+in a context variable while a request is being served (see
+core.middleware.RequestMetricsMiddleware); Mongo commands, outbound HTTP
+calls and LLM calls add to it, and the middleware turns it into a
+``Server-Timing`` header.
+"""
+import contextvars
+import threading
+import time
+from urllib.parse import urlparse
+
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_metrics = []
+_collectors = []
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+
+        with self._lock:
+            series = self._series.get(key)
+
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    labels = _format_labels(key + (("le", bound),))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+
+                labels = _format_labels(key + (("le", "+Inf"),))
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+
+        return lines
+
+
+def register_collector(collector):
+    """Add a callable returning extra exposition lines, computed at scrape time."""
+    _collectors.append(collector)
+
+
+def render():
+    lines = []
+
+    for metric in _metrics:
+        lines.extend(metric.render())
+
+    for collector in _collectors:
+        lines.extend(collector())
+
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to produce a response, by route.",
+    labelnames=("route", "method", "status")
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_mongo_queries", "Mongo commands issued per request, by route.",
+    labelnames=("route",), buckets=COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_mongo_seconds", "Time spent in Mongo commands per request, by route.",
+    labelnames=("route",)
+)
+REQUEST_UPSTREAM_SECONDS = Histogram(
+    "http_request_upstream_seconds", "Time spent in outbound HTTP calls per request, by route.",
+    labelnames=("route",)
+)
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongo_command_duration_seconds", "Mongo command round trips.",
+    labelnames=("command", "outcome")
+)
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "Outbound HTTP calls, until response headers.",
+    labelnames=("host", "status")
+)
+LLM_SECONDS = Histogram(
+    "llm_request_duration_seconds", "LLM calls from request to full reply.",
+    labelnames=("kind",)
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_time_to_first_token_seconds", "Streaming LLM calls from request to first token."
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "LLM tokens, by kind of call and prompt/completion.",
+    labelnames=("kind", "type")
+)
+
+
+class RequestTimings:
+    """
+    Totals for one request, and per upstream host. Shared with any worker
+    threads the request uses.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_count = 0
+        self.db_seconds = 0.0
+        self.upstream_count = 0
+        self.upstream_seconds = 0.0
+        self.upstream_hosts = {}
+        self.llm_count = 0
+        self.llm_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_db(self, seconds):
+        with self._lock:
+            self.db_count += 1
+            self.db_seconds += seconds
+
+    def add_upstream(self, host, seconds):
+        with self._lock:
+            self.upstream_count += 1
+            self.upstream_seconds += seconds
+            count, total = self.upstream_hosts.get(host, (0, 0.0))
+            self.upstream_hosts[host] = (count + 1, total + seconds)
+
+    def add_llm(self, seconds):
+        with self._lock:
+            self.llm_count += 1
+            self.llm_seconds += seconds
+
+    def server_timing(self):
+        total = time.perf_counter() - self.started
+
+        # Host names are valid metric names as they are (letters, digits, "." and "-")
+        hosts = [
+            f'upstream-{host or "unknown"};dur={seconds * 1000:.1f};desc="{count} calls"'
+            for host, (count, seconds) in sorted(self.upstream_hosts.items())
+        ]
+
+        return ", ".join([
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_count} queries"',
+            f'upstream;dur={self.upstream_seconds * 1000:.1f};desc="{self.upstream_count} calls"',
+            *hosts,
+            f'llm;dur={self.llm_seconds * 1000:.1f};desc="{self.llm_count} calls"',
+            f"total;dur={total * 1000:.1f}",
+        ])
+
+
+current_timings = contextvars.ContextVar("current_timings", default=None)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener; pass it to connect() as an event listener."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, "success")
+
+    def failed(self, event):
+        self._record(event, "failure")
+
+    def _record(self, event, outcome):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_SECONDS.observe(seconds, command=event.command_name, outcome=outcome)
+
+        timings = current_timings.get()
+        if timings is not None:
+            timings.add_db(seconds)
+
+
+def observe_upstream(host, status, seconds):
+    UPSTREAM_SECONDS.observe(seconds, host=host, status=status)
+
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add_upstream(host, seconds)
+
+
+def observe_http_response(response, *args, **kwargs):
+    """``requests`` response hook recording the call's time to response headers."""
+    host = urlparse(response.url).hostname or ""
+    observe_upstream(host, response.status_code, response.elapsed.total_seconds())
+    return response
+
+
+def observe_llm(kind, seconds, prompt_tokens=None, completion_tokens=None):
+    LLM_SECONDS.observe(seconds, kind=kind)
+
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, kind=kind, type="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, kind=kind, type="completion")
+
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add_llm(seconds)
@@ -0,0 +1,73 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from core.metrics import (
+    RequestTimings, current_timings, REQUEST_SECONDS, REQUEST_DB_QUERIES,
+    REQUEST_DB_SECONDS, REQUEST_UPSTREAM_SECONDS
+)
+
+
+class RequestMetricsMiddleware:
+    """
+    Time each request and break it down into Mongo, upstream HTTP and LLM time.
+
+    The breakdown is recorded in the per-route histograms served at /metrics
+    and returned to the client in a ``Server-Timing`` header, which also
+    splits upstream time by host (``upstream-<host>``). For streaming
+    responses the header covers only the work done before streaming starts.
+
+    Supports both sync and async stacks, so async views under ASGI are not
+    pushed back onto a thread by this middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+
+        return self.record(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+
+        return self.record(request, response, timings)
+
+    def record(self, request, response, timings):
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match else "unmatched"
+
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - timings.started,
+            route=route,
+            method=request.method,
+            status=response.status_code
+        )
+        REQUEST_DB_QUERIES.observe(timings.db_count, route=route)
+        REQUEST_DB_SECONDS.observe(timings.db_seconds, route=route)
+        REQUEST_UPSTREAM_SECONDS.observe(timings.upstream_seconds, route=route)
+
+        response["Server-Timing"] = timings.server_timing()
+        return response
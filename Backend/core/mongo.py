@@ -0,0 +1,42 @@
+"""
+Async access to the database mongoengine is connected to, for async views.
+
+pymongo's ``AsyncMongoClient`` is bound to the event loop it is first used
+on, so one client is kept per loop. Collections are addressed by the same
+names the mongoengine Documents declare, e.g. ``collection(Message)``.
+"""
+import asyncio
+import weakref
+
+from django.conf import settings
+from pymongo import AsyncMongoClient
+
+from core.metrics import MongoCommandMetrics
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_db():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+
+    if client is None:
+        client = _clients[loop] = AsyncMongoClient(
+            settings.MONGO_URI,
+            event_listeners=[MongoCommandMetrics()]
+        )
+
+    return client[settings.MONGO_DB]
+
+
+def collection(document):
+    """The async collection behind a mongoengine Document class."""
+    return get_async_db()[document._meta["collection"]]
+
+
+async def ainsert(document):
+    """Validate and insert a new mongoengine Document through the async client."""
+    document.validate()
+    result = await collection(type(document)).insert_one(document.to_mongo().to_dict())
+    document.id = result.inserted_id
+    return document
@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 from dotenv import load_dotenv
+from corsheaders.defaults import default_headers
 import os
 
 load_dotenv()
@@ -21,6 +23,148 @@ TOMTOM_API_KEY = os.getenv("TOMTOM_API_KEY")
 UNSPLASH_ACCESS_KEY = os.getenv("UNSPLASH_ACCESS_KEY")
 PEXELS_API_KEY = os.getenv("PEXELS_API_KEY")
 
+# Upstream base URLs (override to point at local stubs)
+HF_API_URL = os.getenv("HF_API_URL", "https://router.huggingface.co/v1/chat/completions")
+TOMTOM_API_URL = os.getenv("TOMTOM_API_URL", "https://api.tomtom.com")
+PEXELS_API_URL = os.getenv("PEXELS_API_URL", "https://api.pexels.com")
+WIKIPEDIA_API_URL = os.getenv("WIKIPEDIA_API_URL", "https://en.wikipedia.org")
+UNSPLASH_API_URL = os.getenv("UNSPLASH_API_URL", "https://api.unsplash.com")
+IMAGE_REQUEST_TIMEOUT = float(os.getenv("IMAGE_REQUEST_TIMEOUT", "3"))
+
+# Per-upstream HTTP clients (chat.upstream): connect/read timeouts in seconds,
+# retries for transient failures, keep-alive pool size and circuit breaker
+UPSTREAM_DEFAULTS = {
+    "connect_timeout": 3.05,
+    "read_timeout": 10,
+    "retries": 2,
+    "backoff": 0.2,
+    "pool_size": 20,
+    # Async views (ASYNC_VIEWS) hold no thread per call, so allow far more
+    # connections at once than the sync pool
+    "async_pool_size": 200,
+    "failure_threshold": 5,
+    "reset_timeout": 30,
+}
+UPSTREAMS = {
+    # Streamed replies can pause between tokens; whole replies take a while
+    "hf": {"read_timeout": float(os.getenv("HF_READ_TIMEOUT", "90")), "retries": 1},
+    "tomtom": {"read_timeout": float(os.getenv("TOMTOM_READ_TIMEOUT", "5"))},
+    # Image lookups already run under NEARBY_IMAGE_DEADLINE, so no retries
+    "pexels": {"read_timeout": IMAGE_REQUEST_TIMEOUT, "retries": 0},
+    "wikipedia": {"read_timeout": IMAGE_REQUEST_TIMEOUT, "retries": 0},
+    "unsplash": {"read_timeout": IMAGE_REQUEST_TIMEOUT, "retries": 0},
+}
+
+# Serve send_message, nearby, geocode and reverse-geocode with the async
+# views in chat.async_views. Only useful under ASGI (core.asgi)
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "false").lower() == "true"
+
+# Render and parse DRF JSON with orjson (core.fastjson) when it is installed
+FAST_JSON = os.getenv("FAST_JSON", "true").lower() == "true" and find_spec("orjson") is not None
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.fastjson.ORJSONRenderer" if FAST_JSON else "rest_framework.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "core.fastjson.ORJSONParser" if FAST_JSON else "rest_framework.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+}
+
+# Concurrent cache misses for one key are loaded once per process; with
+# CACHE_CROSS_WORKER_LOCKS a Mongo lock makes that once across all workers
+CACHE_CROSS_WORKER_LOCKS = os.getenv("CACHE_CROSS_WORKER_LOCKS", "false").lower() == "true"
+CACHE_LOCK_TTL = float(os.getenv("CACHE_LOCK_TTL", "10"))
+CACHE_LOCK_POLL_INTERVAL = float(os.getenv("CACHE_LOCK_POLL_INTERVAL", "0.05"))
+
+# Verified JWT claims and User documents cached per worker process
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "4096"))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv("AUTH_TOKEN_CACHE_TTL", str(15 * 60)))
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+
+# Conversation context sent to the LLM: token budget for system prompt,
+# summary and history, number of recent turns always kept verbatim, how
+# many older messages to collect before folding them into the summary, and
+# threads per process that fold summaries after replies
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "4"))
+CONTEXT_SUMMARY_BATCH = int(os.getenv("CONTEXT_SUMMARY_BATCH", "6"))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "400"))
+CONTEXT_FOLD_WORKERS = int(os.getenv("CONTEXT_FOLD_WORKERS", "2"))
+
+# Cached LLM replies for short conversations (at most RESPONSE_CACHE_MAX_TURNS
+# user messages); chats can opt out individually
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_TURNS = int(os.getenv("RESPONSE_CACHE_MAX_TURNS", "1"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 60 * 60)))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+
+# Background reply generation (send_message with "async": true). Each web
+# process starts GENERATION_WORKERS threads on first use; set it to 0 and run
+# `manage.py run_generation_workers` to generate in dedicated processes only
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "2"))
+GENERATION_POLL_INTERVAL = float(os.getenv("GENERATION_POLL_INTERVAL", "2"))
+GENERATION_JOB_LEASE = int(os.getenv("GENERATION_JOB_LEASE", "300"))
+GENERATION_JOB_MAX_ATTEMPTS = int(os.getenv("GENERATION_JOB_MAX_ATTEMPTS", "2"))
+
+# Admission control for send_message: a token bucket per user (ADMISSION_RATE
+# messages per second, bursts of ADMISSION_BURST) and caps on replies being
+# generated at once, per user and overall. "memory" limits each process on
+# its own; "mongo" shares the limits across workers
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_BACKEND = os.getenv("ADMISSION_BACKEND", "memory")
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "0.5"))
+ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", "10"))
+ADMISSION_USER_INFLIGHT = int(os.getenv("ADMISSION_USER_INFLIGHT", "2"))
+ADMISSION_GLOBAL_INFLIGHT = int(os.getenv("ADMISSION_GLOBAL_INFLIGHT", "32"))
+ADMISSION_SLOT_LEASE = int(os.getenv("ADMISSION_SLOT_LEASE", "300"))
+
+# Idempotency-Key support for send_message: how long keys are remembered,
+# and how long a pending key is held before another request may take it over
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", str(24 * 60 * 60)))
+IDEMPOTENCY_LEASE = int(os.getenv("IDEMPOTENCY_LEASE", "300"))
+
+# Chat history / chat list pagination; the hard caps also bound the
+# unpaginated responses old clients still get
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "50"))
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "500"))
+CHAT_LIST_MAX_CHATS = int(os.getenv("CHAT_LIST_MAX_CHATS", "200"))
+
+# Serve chat history and the chat list from raw BSON rows instead of
+# hydrated mongoengine documents
+CHAT_RAW_READS = os.getenv("CHAT_RAW_READS", "true").lower() == "true"
+
+# Place image lookups for nearby_places
+NEARBY_IMAGE_WORKERS = int(os.getenv("NEARBY_IMAGE_WORKERS", "8"))
+NEARBY_IMAGE_DEADLINE = float(os.getenv("NEARBY_IMAGE_DEADLINE", "2.5"))
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 60 * 60)))
+IMAGE_CACHE_NEGATIVE_TTL = int(os.getenv("IMAGE_CACHE_NEGATIVE_TTL", str(60 * 60)))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "2048"))
+
+# TomTom nearbySearch results, cached per geohash cell
+NEARBY_CACHE_TTL = int(os.getenv("NEARBY_CACHE_TTL", str(6 * 60 * 60)))
+NEARBY_CACHE_SIZE = int(os.getenv("NEARBY_CACHE_SIZE", "512"))
+NEARBY_FETCH_LIMIT = int(os.getenv("NEARBY_FETCH_LIMIT", "50"))
+
+# Mongo cursor batch size for NDJSON chat export, and insert_many batch
+# size for imports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Local POI store: cells searched within PLACE_COVERAGE_TTL are answered
+# from the places collection instead of TomTom
+PLACE_STORE_ENABLED = os.getenv("PLACE_STORE_ENABLED", "true").lower() == "true"
+PLACE_COVERAGE_TTL = int(os.getenv("PLACE_COVERAGE_TTL", str(7 * 24 * 60 * 60)))
+
+# TomTom geocode / reverseGeocode results
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(7 * 24 * 60 * 60)))
+GEOCODE_CACHE_NEGATIVE_TTL = int(os.getenv("GEOCODE_CACHE_NEGATIVE_TTL", str(60 * 60)))
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "2048"))
+REVERSE_GEOCODE_PRECISION = int(os.getenv("REVERSE_GEOCODE_PRECISION", "3"))
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -54,6 +198,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.RequestMetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -138,13 +283,20 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
+
 
 from mongoengine import connect
+from core.metrics import MongoCommandMetrics
 import os
 
+MONGO_DB = "travel_ai"
+MONGO_URI = os.getenv("MONGO_URI")
+
 connect(
-    db="travel_ai",
-    host=os.getenv("MONGO_URI")
+    db=MONGO_DB,
+    host=MONGO_URI,
+    event_listeners=[MongoCommandMetrics()]
 )
 
 from datetime import timedelta
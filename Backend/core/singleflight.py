@@ -0,0 +1,66 @@
+import threading
+
+from core.metrics import Counter
+
+SINGLEFLIGHT_CALLS = Counter(
+    "singleflight_calls_total",
+    "Calls through single-flight groups: 'leader' ran the function, 'collapsed' waited for a leader.",
+    labelnames=("group", "result")
+)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait and receive the same result, or the same
+    exception. Once the leader finishes the key is forgotten, so this only
+    removes duplicate in-flight work and never serves stale results.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.leaders = 0
+        self.collapsed = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.collapsed += 1
+
+        SINGLEFLIGHT_CALLS.inc(group=self.name, result="leader" if leader else "collapsed")
+
+        if not leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -14,15 +14,21 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from django.contrib import admin
 from django.urls import path, include
 
+from core import metrics
+
 def health_check(_):
     return JsonResponse({"status": "Server is running"}, status=200)
 
+def metrics_view(_):
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4")
+
 urlpatterns = [
     path("", health_check),
+    path("metrics", metrics_view),
     path("admin/", admin.site.urls),
     path("api/", include("users.urls")),
     path("api/chat/", include("chat.urls")),
@@ -1,20 +1,105 @@
+import time
+
 import jwt
+from bson import ObjectId
 from django.conf import settings
+
+from core.cache import LRUCache, MISSING
 from users.models import User
 
+# Decoded claims per raw token. An entry never outlives the token's own exp,
+# so expired tokens are rejected exactly as if they were decoded every time.
+token_cache = LRUCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_TOKEN_CACHE_TTL)
+
+# User documents by id. Saves and deletes through the model invalidate the
+# entry in this process; other workers see the change within the TTL.
+user_cache = LRUCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_USER_CACHE_TTL)
+
+
+class AuthError(Exception):
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def decode_token(token):
+    claims = token_cache.get(token)
+
+    if claims is MISSING:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+
+        ttl = settings.AUTH_TOKEN_CACHE_TTL
+        if "exp" in claims:
+            ttl = min(ttl, claims["exp"] - time.time())
+
+        token_cache.set(token, claims, ttl=ttl)
+
+    return claims
+
+
+def get_user_by_id(user_id):
+    user_id = str(user_id)
+    user = user_cache.get(user_id)
+
+    if user is MISSING:
+        user = User.objects(id=user_id).first()
+
+        # Unknown ids are not cached, so a user created meanwhile is found
+        if user is not None:
+            user_cache.set(user_id, user)
 
-def get_user_from_request(request):
+    return user
+
+
+def invalidate_user(user_id):
+    user_cache.delete(str(user_id))
+
+
+def authenticate(request, trust_claims=False):
+    """
+    Return the user behind the request's Bearer token, or raise AuthError.
+
+    With ``trust_claims`` the verified token is taken at its word and no
+    lookup is made: the result is an unsaved ``User`` carrying only the id
+    and email, good for endpoints that just filter by the user.
+    """
     auth_header = request.headers.get("Authorization")
 
     if not auth_header:
-        return None
+        raise AuthError("Authorization header missing")
 
     try:
         token = auth_header.split()[1]
-        decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+    except IndexError:
+        raise AuthError("Invalid token")
 
-        user = User.objects(id=decoded["user_id"]).first()
-        return user
+    return authenticate_token(token, trust_claims=trust_claims)
 
+
+def authenticate_token(token, trust_claims=False):
+    """authenticate for a raw token rather than a request."""
+    try:
+        claims = decode_token(token)
+        user_id = ObjectId(claims["user_id"])
+    except jwt.ExpiredSignatureError:
+        raise AuthError("Token expired")
     except Exception:
+        raise AuthError("Invalid token")
+
+    if trust_claims:
+        return User(id=user_id, email=claims.get("email"))
+
+    user = get_user_by_id(user_id)
+
+    if not user:
+        raise AuthError("User not found", status=404)
+
+    return user
+
+
+def get_user_from_request(request, trust_claims=False):
+    try:
+        return authenticate(request, trust_claims=trust_claims)
+    except AuthError:
         return None
@@ -11,3 +11,17 @@ class User(Document):
     meta = {
         "collection": "users"
     }
+
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        self._invalidate_cached()
+        return result
+
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        self._invalidate_cached()
+
+    def _invalidate_cached(self):
+        # Imported here: auth_utils imports this module
+        from users.auth_utils import invalidate_user
+        invalidate_user(self.id)
@@ -4,6 +4,7 @@ from rest_framework import status
 from google.oauth2 import id_token
 from google.auth.transport import requests
 from .models import User
+from .auth_utils import authenticate, AuthError
 from datetime import datetime, timedelta
 from django.conf import settings
 import jwt
@@ -62,36 +63,15 @@ def google_login(request):
         return Response({"error": str(e)}, status=500)
 
 
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
-from django.conf import settings
-from .models import User
-import jwt
-
-
 @api_view(["GET"])
 def profile(request):
-    auth_header = request.headers.get("Authorization")
-
-    if not auth_header:
-        return Response({"error": "Authorization header missing"}, status=401)
-
     try:
-        token = auth_header.split()[1]
-        decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-
-        user = User.objects(id=decoded["user_id"]).first()
-
-        if not user:
-            return Response({"error": "User not found"}, status=404)
-
-        return Response({
-            "email": user.email,
-            "name": user.name,
-            "image": user.image,
-        })
-
-    except jwt.ExpiredSignatureError:
-        return Response({"error": "Token expired"}, status=401)
-    except jwt.InvalidTokenError:
-        return Response({"error": "Invalid token"}, status=401)
+        user = authenticate(request)
+    except AuthError as e:
+        return Response({"error": e.message}, status=e.status)
+
+    return Response({
+        "email": user.email,
+        "name": user.name,
+        "image": user.image,
+    })